@@ -0,0 +1,180 @@
+'''
+Stand-in for the parts of the qrenderdoc module the exporter uses.
+Dialogs are answered from queues and logged instead of being shown, replay invokes run inline.
+'''
+
+import enum
+import threading
+
+class DialogButton(enum.IntEnum):
+    OK = 1
+    Cancel = 2
+    Yes = 3
+    No = 4
+
+class WindowMenu(enum.IntEnum):
+    Window = 1
+    Tools = 2
+
+class CaptureViewer:
+    def OnCaptureLoaded(self):
+        pass
+
+    def OnCaptureClosed(self):
+        pass
+
+    def OnSelectedEventChanged(self, eid):
+        pass
+
+    def OnEventChanged(self, eid):
+        pass
+
+class MiniQtHelper:
+    def __init__(self):
+        self.widgets = {}
+        self.next_widget = 0
+
+    def create_widget(self):
+        self.next_widget += 1
+        return self.next_widget
+
+    def InvokeOntoUIThread(self, callback):
+        callback()
+
+    def CreateToplevelWidget(self, title, closed):
+        return self.create_widget()
+
+    def CreateVerticalContainer(self):
+        return self.create_widget()
+
+    def CreateButton(self, pressed):
+        return self.create_widget()
+
+    def CreateLabel(self):
+        return self.create_widget()
+
+    def CreateProgressBar(self, horizontal = True):
+        return self.create_widget()
+
+    def SetProgressBarValue(self, widget, value):
+        pass
+
+    def AddWidget(self, parent, child):
+        pass
+
+    def SetWidgetText(self, widget, text):
+        self.widgets[widget] = text
+
+    def SetWidgetEnabled(self, widget, enabled):
+        pass
+
+    def ShowWidgetAsDialog(self, widget):
+        pass
+
+    def CloseCurrentDialog(self, success):
+        pass
+
+    def CloseToplevelWidget(self, widget):
+        pass
+
+class Extensions:
+    def __init__(self):
+        self.mqt = MiniQtHelper()
+        self.menus = {}
+        self.log = []
+        self.directory_answers = []
+        self.question_answer = DialogButton.No
+
+    def RegisterWindowMenu(self, base, submenus, callback):
+        self.menus[tuple(submenus)] = callback
+
+    def ErrorDialog(self, text, title = ''):
+        self.log.append(('error', text))
+
+    def MessageDialog(self, text, title = ''):
+        self.log.append(('message', text))
+
+    def QuestionDialog(self, text, options, title = ''):
+        self.log.append(('question', text))
+        return self.question_answer
+
+    def OpenDirectoryName(self, caption = '', dir = ''):
+        return self.directory_answers.pop(0) if self.directory_answers else ''
+
+    def GetMiniQtHelper(self):
+        return self.mqt
+
+class ReplayManager:
+    def __init__(self, controller):
+        self.controller = controller
+        self.lock = threading.Lock()
+        self.invokes = 0
+
+    def BlockInvoke(self, callback):
+        with self.lock:
+            self.invokes += 1
+            callback(self.controller)
+
+    def AsyncInvoke(self, tag, callback):
+        self.BlockInvoke(callback)
+
+class CaptureContext:
+    def __init__(self, capture):
+        self.capture = capture
+        self.ext = Extensions()
+        self.replay = ReplayManager(capture.controller)
+        self.viewers = []
+        self.eid = capture.eid
+        self.buffers_by_id = { b.resourceId: b for b in capture.buffers }
+        self.textures_by_id = { t.resourceId: t for t in capture.textures }
+
+    def Extensions(self):
+        return self.ext
+
+    def Replay(self):
+        return self.replay
+
+    def IsCaptureLoaded(self):
+        return True
+
+    def GetCaptureFilename(self):
+        return self.capture.filename
+
+    def CurEvent(self):
+        return self.eid
+
+    def CurVulkanPipelineState(self):
+        return self.capture.controller.GetVulkanPipelineState()
+
+    def CurPipelineState(self):
+        return self.capture.controller.GetPipelineState()
+
+    def GetAction(self, eid):
+        return self.capture.actions_by_eid.get(eid)
+
+    def GetBuffers(self):
+        return self.capture.buffers
+
+    def GetTextures(self):
+        return self.capture.textures
+
+    def GetBuffer(self, resource):
+        return self.buffers_by_id.get(resource)
+
+    def GetTexture(self, resource):
+        return self.textures_by_id.get(resource)
+
+    def GetResourceName(self, resource):
+        return f'Resource {resource}'
+
+    def SetEventID(self, exclude, selected, eid, force = False):
+        self.eid = eid
+        self.capture.controller.SetFrameEvent(eid, True)
+        for viewer in list(self.viewers):
+            viewer.OnEventChanged(eid)
+
+    def AddCaptureViewer(self, viewer):
+        self.viewers.append(viewer)
+
+    def RemoveCaptureViewer(self, viewer):
+        self.viewers.remove(viewer)
@@ -0,0 +1,365 @@
+'''
+Stand-in for the parts of the renderdoc module the exporter uses, for benchmarking without a GPU.
+Enum values are arbitrary, only identity matters.
+'''
+
+import enum
+
+class DescriptorType(enum.IntEnum):
+    Unknown = 0
+    ConstantBuffer = 1
+    Sampler = 2
+    ImageSampler = 3
+    Image = 4
+    Buffer = 5
+    TypedBuffer = 6
+    ReadWriteImage = 7
+    ReadWriteTypedBuffer = 8
+    ReadWriteBuffer = 9
+    AccelerationStructure = 10
+
+class TextureType(enum.IntEnum):
+    Unknown = 0
+    Buffer = 1
+    Texture1D = 2
+    Texture1DArray = 3
+    Texture2D = 4
+    TextureRect = 5
+    Texture2DArray = 6
+    Texture2DMS = 7
+    Texture2DMSArray = 8
+    Texture3D = 9
+    TextureCube = 10
+    TextureCubeArray = 11
+
+class AddressMode(enum.IntEnum):
+    Wrap = 0
+    Mirror = 1
+    MirrorOnce = 2
+    ClampEdge = 3
+    ClampBorder = 4
+    MirrorClamp = 5
+
+class CompareFunction(enum.IntEnum):
+    Never = 0
+    AlwaysTrue = 1
+    Less = 2
+    LessEqual = 3
+    Greater = 4
+    GreaterEqual = 5
+    Equal = 6
+    NotEqual = 7
+
+class FilterMode(enum.IntEnum):
+    NoFilter = 0
+    Point = 1
+    Linear = 2
+    Cubic = 3
+    Anisotropic = 4
+
+class FilterFunction(enum.IntEnum):
+    Normal = 0
+    Comparison = 1
+    Minimum = 2
+    Maximum = 3
+
+class ResourceFormatType(enum.IntEnum):
+    Regular = 0
+    Undefined = 1
+    BC1 = 2
+    BC7 = 8
+    D16S8 = 20
+    D24S8 = 21
+    D32S8 = 22
+
+class TextureCategory(enum.IntFlag):
+    NoFlags = 0
+    ShaderRead = 1
+    ColorTarget = 2
+    DepthTarget = 4
+    ShaderReadWrite = 8
+
+class ShaderStage(enum.IntEnum):
+    Vertex = 0
+    Compute = 5
+
+class ResourceUsage(enum.IntEnum):
+    Unused = 0
+    CS_Resource = 1
+    CS_RWResource = 2
+    CS_Constants = 3
+    Clear = 4
+    CopySrc = 5
+    CopyDst = 6
+    Copy = 7
+    Discard = 8
+    GenMips = 9
+    Resolve = 10
+    ResolveSrc = 11
+    ResolveDst = 12
+    CPUWrite = 13
+
+class ActionFlags(enum.IntFlag):
+    NoFlags = 0
+    Drawcall = 1
+    Dispatch = 2
+
+class ResultCode(enum.IntEnum):
+    Succeeded = 0
+    FileIOFailed = 1
+
+class ResourceId(int):
+    # Opaque in RenderDoc, int() gives the id.
+    pass
+
+class ResourceFormat:
+    __slots__ = ('name', 'size', 'type', 'block')
+
+    def __init__(self, name = 'R32_UINT', size = 4, type = ResourceFormatType.Regular, block = False):
+        self.name = name
+        self.size = size
+        self.type = type
+        self.block = block
+
+    def Name(self):
+        return self.name
+
+    def ElementSize(self):
+        return self.size
+
+    def BlockFormat(self):
+        return self.block
+
+    def __eq__(self, other):
+        return isinstance(other, ResourceFormat) and self.name == other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+class Subresource:
+    def __init__(self, mip = 0, slice = 0, sample = 0):
+        self.mip = mip
+        self.slice = slice
+        self.sample = sample
+
+class Descriptor:
+    __slots__ = ('type', 'resource', 'byteOffset', 'byteSize', 'format', 'textureType',
+                 'firstMip', 'numMips', 'firstSlice', 'numSlices', 'minLODClamp')
+
+    def __init__(self, type = DescriptorType.Unknown, resource = 0, byteOffset = 0, byteSize = 0, format = None,
+                 textureType = TextureType.Unknown, firstMip = 0, numMips = 1, firstSlice = 0, numSlices = 1):
+        self.type = type
+        self.resource = resource
+        self.byteOffset = byteOffset
+        self.byteSize = byteSize
+        self.format = format if format else ResourceFormat()
+        self.textureType = textureType
+        self.firstMip = firstMip
+        self.numMips = numMips
+        self.firstSlice = firstSlice
+        self.numSlices = numSlices
+        self.minLODClamp = 0.0
+
+class DescriptorAccess:
+    __slots__ = ('index', 'arrayElement')
+
+    def __init__(self, index = 0, arrayElement = 0):
+        self.index = index
+        self.arrayElement = arrayElement
+
+class SamplerFilter:
+    def __init__(self):
+        self.minify = FilterMode.Linear
+        self.magnify = FilterMode.Linear
+        self.mip = FilterMode.Point
+        self.filter = FilterFunction.Normal
+
+class SamplerDescriptor:
+    def __init__(self, creationTimeConstant = False):
+        self.addressU = AddressMode.Wrap
+        self.addressV = AddressMode.ClampEdge
+        self.addressW = AddressMode.MirrorOnce
+        self.compareFunction = CompareFunction.Never
+        self.maxAnisotropy = 1.0
+        self.minLOD = 0.0
+        self.maxLOD = 1000.0
+        self.mipBias = 0.0
+        self.filter = SamplerFilter()
+        self.creationTimeConstant = creationTimeConstant
+
+    def UseBorder(self):
+        return False
+
+class UsedDescriptor:
+    __slots__ = ('access', 'descriptor', 'sampler')
+
+    def __init__(self, access, descriptor = None, sampler = None):
+        self.access = access
+        self.descriptor = descriptor
+        self.sampler = sampler
+
+class ShaderResource:
+    def __init__(self, name, bindArraySize, fixedBindSetOrSpace = 0, fixedBindNumber = 0):
+        self.name = name
+        self.bindArraySize = bindArraySize
+        self.fixedBindSetOrSpace = fixedBindSetOrSpace
+        self.fixedBindNumber = fixedBindNumber
+
+class ConstantBlock(ShaderResource):
+    def __init__(self, name, bindArraySize, fixedBindSetOrSpace = 0, fixedBindNumber = 0):
+        super().__init__(name, bindArraySize, fixedBindSetOrSpace, fixedBindNumber)
+        self.bufferBacked = True
+        self.compileConstants = False
+
+class ShaderSampler(ShaderResource):
+    pass
+
+class ShaderReflection:
+    def __init__(self):
+        self.resourceId = 0
+        self.rawBytes = b''
+        self.readOnlyResources = []
+        self.readWriteResources = []
+        self.constantBlocks = []
+        self.samplers = []
+
+class BufferDescription:
+    __slots__ = ('resourceId', 'length', 'gpuAddress')
+
+    def __init__(self, resourceId, length, gpuAddress):
+        self.resourceId = resourceId
+        self.length = length
+        self.gpuAddress = gpuAddress
+
+class TextureDescription:
+    def __init__(self, resourceId, width, height, depth, mips, arraysize, format,
+                 dimension = 2, creationFlags = TextureCategory.ShaderRead):
+        self.resourceId = resourceId
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.mips = mips
+        self.arraysize = arraysize
+        self.format = format
+        self.dimension = dimension
+        self.creationFlags = creationFlags
+
+class ActionDescription:
+    def __init__(self, eventId, dispatchDimension, flags = ActionFlags.Dispatch, children = None):
+        self.eventId = eventId
+        self.dispatchDimension = dispatchDimension
+        self.flags = flags
+        self.children = children if children else []
+
+class EventUsage:
+    def __init__(self, eventId, usage):
+        self.eventId = eventId
+        self.usage = usage
+
+class VKState:
+    def __init__(self, pushconsts):
+        self.compute = True
+        self.pushconsts = pushconsts
+
+class PipeState:
+    def __init__(self, capture):
+        self.capture = capture
+
+    def GetShaderReflection(self, stage):
+        return self.capture.reflection
+
+    def GetReadOnlyResources(self, stage, onlyUsed = False):
+        return self.capture.ro
+
+    def GetReadWriteResources(self, stage, onlyUsed = False):
+        return self.capture.rw
+
+    def GetConstantBlocks(self, stage, onlyUsed = False):
+        return self.capture.cbv
+
+    def GetSamplers(self, stage, onlyUsed = False):
+        return self.capture.samplers
+
+class ReplayController:
+    # Serves synthetic data, see bench/synthetic.py for how captures are built.
+    def __init__(self, capture):
+        self.capture = capture
+        self.frame_event = capture.eid
+        self.buffer_reads = 0
+        self.texture_reads = 0
+        self.bytes_read = 0
+
+    def GetVulkanPipelineState(self):
+        return VKState(self.capture.push)
+
+    def GetPipelineState(self):
+        return PipeState(self.capture)
+
+    def GetBuffers(self):
+        return self.capture.buffers
+
+    def GetTextures(self):
+        return self.capture.textures
+
+    def GetRootActions(self):
+        return self.capture.root_actions
+
+    def GetUsage(self, resource):
+        return self.capture.usage.get(resource, [])
+
+    def SetFrameEvent(self, eid, force):
+        self.frame_event = eid
+
+    def GetBufferData(self, resource, offset, length):
+        buf = self.capture.buffers_by_id[resource]
+        if length == 0:
+            length = buf.length - offset
+        length = max(0, min(length, buf.length - offset))
+        self.buffer_reads += 1
+        self.bytes_read += length
+        return self.capture.buffer_data(resource, offset, length)
+
+    def GetTextureData(self, resource, sub):
+        tex = self.capture.textures_by_id[resource]
+        size = max(1, tex.width >> sub.mip) * max(1, tex.height >> sub.mip) * max(1, tex.depth >> sub.mip) * tex.format.ElementSize()
+        self.texture_reads += 1
+        self.bytes_read += size
+        return self.capture.texture_data(resource, sub, size)
+
+    def Shutdown(self):
+        pass
+
+# Headless entry points, the capture to serve is chosen by setting capture_loader.
+capture_loader = None
+
+class GlobalEnvironment:
+    pass
+
+class ReplayOptions:
+    pass
+
+def InitialiseReplay(env, args):
+    pass
+
+def ShutdownReplay():
+    pass
+
+class CaptureFile:
+    def __init__(self):
+        self.capture = None
+
+    def OpenFile(self, path, filetype, progress):
+        self.capture = capture_loader(path)
+        return ResultCode.Succeeded
+
+    def LocalReplaySupport(self):
+        return True
+
+    def OpenCapture(self, opts, progress):
+        return ResultCode.Succeeded, self.capture.controller
+
+    def Shutdown(self):
+        pass
+
+def OpenCaptureFile():
+    return CaptureFile()
@@ -0,0 +1,158 @@
+'''
+Exporter benchmarks on synthetic captures, no GPU or real capture required.
+The stand-in renderdoc/qrenderdoc modules in bench/fake are put ahead of any real ones on the path.
+
+    python3 bench/run.py
+    python3 bench/run.py --worst-case
+    python3 bench/run.py --only spirv bda --repeat 10
+'''
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(bench_dir, 'fake'))
+sys.path.insert(0, os.path.dirname(bench_dir))
+
+import qrenderdoc as qrd
+import exporter
+import synthetic
+
+MiB = 1024 * 1024
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description = 'Benchmark the D3D12 Replayer exporter on synthetic captures.')
+    parser.add_argument('--only', nargs = '+', choices = ['spirv', 'classification', 'bda', 'export'], help = 'Benchmarks to run')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'Runs per benchmark, the fastest is reported')
+    parser.add_argument('--worst-case', action = 'store_true',
+                        help = 'Million-entry heaps, 50k buffers, 2048 layer texture arrays and 64 MiB of SPIR-V')
+    parser.add_argument('--descriptors', type = int, default = 100000, help = 'SRV/UAV heap entries used by the dispatch')
+    parser.add_argument('--buffers', type = int, default = 5000)
+    parser.add_argument('--buffer-size', type = int, default = 0x4000)
+    parser.add_argument('--texture-arrays', type = int, default = 4)
+    parser.add_argument('--texture-layers', type = int, default = 256)
+    parser.add_argument('--spirv-words', type = int, default = 1 << 20)
+    parser.add_argument('--offset-buffer', action = 'store_true', help = 'Bind a legacy offset buffer')
+    parser.add_argument('--lookups', type = int, default = 100000, help = 'BDA lookups per run')
+    parser.add_argument('--keep', help = 'Export into this directory and keep it, instead of a temporary one')
+    args = parser.parse_args(argv)
+    if args.worst_case:
+        args.descriptors = 1000000
+        args.buffers = 50000
+        args.texture_layers = 2048
+        args.spirv_words = 16 << 20
+    return args
+
+def measure(fn, repeat):
+    # Exporter logging would otherwise dominate, and skew, the timings.
+    best = None
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def report(name, seconds, amount, unit):
+    print(f'{name:<28} {seconds * 1000.0:10.2f} ms {amount / seconds:14.1f} {unit}/s')
+
+def bench_spirv(args, cap):
+    blob = cap.reflection.rawBytes
+    # Bypass the cache, every run has to walk the whole module.
+    seconds, _ = measure(lambda: exporter.scan_spirv_resources(blob), args.repeat)
+    report('parse_spirv_resources', seconds, len(blob) / MiB, 'MiB')
+
+def bench_classification(args, cap):
+    source = exporter.ReplayExportSource(cap.controller)
+    options = exporter.ExportOptions()
+    # Warm up the SPIR-V and resource caches so only the per-dispatch work is timed.
+    measure(lambda: exporter.analyze_dispatch(source, cap.eid, options), 1)
+    seconds, _ = measure(lambda: exporter.analyze_dispatch(source, cap.eid, options), args.repeat)
+    report('analyze_dispatch', seconds, len(cap.ro) + len(cap.rw), 'descriptors')
+
+def bench_bda(args, cap):
+    seconds, index = measure(lambda: exporter.BufferAddressIndex(cap.buffers), args.repeat)
+    report('BufferAddressIndex build', seconds, len(cap.buffers), 'buffers')
+
+    rng = random.Random(1234)
+    addresses = []
+    for _ in range(args.lookups):
+        buf = rng.choice(cap.buffers)
+        # Some lookups land in the gaps between buffers and miss.
+        addresses.append(buf.gpuAddress + rng.randrange(0, 2 * buf.length))
+
+    def lookup_all():
+        for bda in addresses:
+            index.lookup(bda, 0x10000)
+
+    seconds, _ = measure(lookup_all, args.repeat)
+    report('BufferAddressIndex lookup', seconds, len(addresses), 'lookups')
+
+def directory_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            total += os.path.getsize(os.path.join(root, f))
+    return total
+
+def bench_export(args, cap):
+    # AsyncInvoke runs inline here, so a speculative plan would be left for the next run to consume.
+    os.environ['RDOC_EXPORT_SPECULATIVE'] = '0'
+    ctx = qrd.CaptureContext(cap)
+    exporter.register('1.36', ctx)
+    callback = ctx.Extensions().menus[('Export vkd3d-proton to D3D12 Replayer Capture',)]
+    base_dir = args.keep if args.keep else tempfile.mkdtemp(prefix = 'rdoc-export-bench-')
+
+    def run():
+        shutil.rmtree(base_dir, ignore_errors = True)
+        os.makedirs(base_dir)
+        ctx.Extensions().directory_answers = [base_dir]
+        cap.controller.buffer_reads = 0
+        cap.controller.texture_reads = 0
+        callback(ctx, None)
+
+    try:
+        seconds, _ = measure(run, args.repeat)
+        errors = [ text for kind, text in ctx.Extensions().log if kind == 'error' ]
+        if errors:
+            print(f'export_callback failed: {errors[-1]}')
+            return
+        report('export_callback', seconds, directory_size(base_dir) / MiB, 'MiB')
+        print(f'{"":<28} {cap.controller.buffer_reads} buffer reads, {cap.controller.texture_reads} texture reads')
+    finally:
+        exporter.unregister()
+        if not args.keep:
+            shutil.rmtree(base_dir, ignore_errors = True)
+
+benchmarks = {
+    'spirv': bench_spirv,
+    'classification': bench_classification,
+    'bda': bench_bda,
+    'export': bench_export,
+}
+
+def main(argv):
+    args = parse_arguments(argv)
+    start = time.perf_counter()
+    cap = synthetic.build_capture(descriptors = args.descriptors, buffers = args.buffers, buffer_size = args.buffer_size,
+                                  texture_arrays = args.texture_arrays, texture_layers = args.texture_layers,
+                                  spirv_words = args.spirv_words, offset_buffer = args.offset_buffer)
+    print(f'Built synthetic capture in {time.perf_counter() - start:.2f} s: {len(cap.ro) + len(cap.rw)} descriptors, '
+          f'{len(cap.buffers)} buffers, {len(cap.textures)} x {args.texture_layers} layer textures, '
+          f'{len(cap.reflection.rawBytes) // MiB} MiB SPIR-V')
+
+    for name in args.only if args.only else benchmarks.keys():
+        benchmarks[name](args, cap)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,214 @@
+'''
+Generators for synthetic captures served by the stand-in renderdoc module in bench/fake.
+The layout mimics what vkd3d-proton produces: bindless SRV/UAV/CBV/sampler heaps indexed through
+dxil-spirv resource tables, root descriptors passed as BDAs in push constants and a Push CBV.
+'''
+
+import array
+import renderdoc as rd
+
+def encode_string(s):
+    b = s.encode() + b'\0'
+    b += b'\0' * (-len(b) % 4)
+    return list(array.array('I', b))
+
+class SpirvBuilder():
+    def __init__(self):
+        self.words = [0x07230203, 0x10000, 0, 0, 0]
+        self.next_id = 1
+        self.consts = {}
+        self.strings = {}
+        self.int32 = self.id()
+        self.op(21, [self.int32, 32, 0])
+        self.ext = self.id()
+        self.op(11, [self.ext] + encode_string('NonSemantic.dxil-spirv.signature'))
+        self.void = self.id()
+
+    def id(self):
+        self.next_id += 1
+        return self.next_id
+
+    def op(self, opcode, args):
+        self.words.append(((len(args) + 1) << 16) | opcode)
+        self.words.extend(args)
+
+    def string(self, s):
+        if s not in self.strings:
+            i = self.id()
+            self.op(7, [i] + encode_string(s))
+            self.strings[s] = i
+        return self.strings[s]
+
+    def const(self, v):
+        if v not in self.consts:
+            i = self.id()
+            self.op(43, [self.int32, i, v])
+            self.consts[v] = i
+        return self.consts[v]
+
+    def resource(self, kind, index, a, b):
+        args = [self.string(kind), self.const(index), self.const(a), self.const(b)]
+        self.op(12, [self.void, self.id(), self.ext, 0] + args)
+
+    def root_signature(self, words):
+        args = [self.string('RootSignature')] + [self.const(w) for w in words]
+        self.op(12, [self.void, self.id(), self.ext, 1] + args)
+
+    def pad(self, num_words):
+        # OpDecorate filler, stands in for the bulk of a real shader which the exporter skips over.
+        for i in range(num_words // 4):
+            self.op(71, [i, 30, i])
+
+    def tobytes(self):
+        return array.array('I', self.words).tobytes()
+
+def build_spirv(num_words, dxil_name = 'shader_0123456789abcdef.dxil'):
+    spv = SpirvBuilder()
+    spv.string(dxil_name)
+    spv.pad(num_words)
+    spv.resource('ResourceTable', 0, 0, 4)
+    spv.resource('SamplerTable', 1, 4, 4)
+    spv.resource('Constant', 2, 8, 8)
+    spv.resource('UAV', 3, 16, 8)
+    spv.resource('CBV', 4, 24, 8)
+    spv.resource('PushCBV', 5, 0, 2)
+    spv.resource('SRV', 6, 32, 8)
+    spv.root_signature([0x30435344, 0x12345678, 0xffffffff, 7])
+    return spv.tobytes()
+
+def pattern(seed, offset, length):
+    base = bytes((seed * 7 + i) & 0xff for i in range(256))
+    start = offset & 0xff
+    return (base * ((length + start) // 256 + 1))[start:start + length]
+
+class SyntheticCapture():
+    def __init__(self):
+        self.filename = 'synthetic.rdc'
+        self.eid = 100
+        self.usage = {}
+        self.offset_buffer_id = 0
+        self.offset_buffer_data = b''
+        self.controller = rd.ReplayController(self)
+
+    def buffer_data(self, resource, offset, length):
+        if resource == self.offset_buffer_id:
+            return self.offset_buffer_data[offset:offset + length]
+        return pattern(resource, offset, length)
+
+    def texture_data(self, resource, sub, size):
+        return pattern(resource + sub.mip * 3 + sub.slice * 5, 0, size)
+
+def used(index, element, **kw):
+    return rd.UsedDescriptor(rd.DescriptorAccess(index, element), rd.Descriptor(**kw))
+
+def split_bda(push, offset, bda):
+    push[offset] = bda & 0xffffffff
+    push[offset + 1] = bda >> 32
+
+def build_capture(descriptors = 100000, buffers = 5000, buffer_size = 0x4000,
+                  texture_arrays = 4, texture_layers = 256, texture_size = 64,
+                  spirv_words = 1 << 20, offset_buffer = False):
+    '''
+    Builds a capture with a single dispatch. The heaps hold `descriptors` SRV/UAV entries spread over
+    `buffers` buffers and `texture_arrays` arrays of `texture_layers` layers each.
+    '''
+    cap = SyntheticCapture()
+    D = rd.DescriptorType
+    T = rd.TextureType
+    bindless = 1000000
+
+    refl = rd.ShaderReflection()
+    refl.resourceId = rd.ResourceId(5000)
+    refl.rawBytes = build_spirv(spirv_words)
+    refl.readOnlyResources = [
+        rd.ShaderResource('SRV_StructuredBuffer_16', bindless),
+        rd.ShaderResource('SRV_Texture', bindless),
+        rd.ShaderResource('SRV_Typed', bindless),
+    ]
+    refl.readWriteResources = [
+        rd.ShaderResource('UAV_StructuredBuffer_16', bindless),
+        rd.ShaderResource('UAV_ByteAddressBuffer_4', bindless),
+        rd.ShaderResource('UAV_Typed', bindless),
+        rd.ShaderResource('OffsetBuffer', 1, 1, 1),
+        rd.ShaderResource('UAV_Image', bindless),
+    ]
+    refl.constantBlocks = [
+        rd.ConstantBlock('CBVHeap', bindless),
+        rd.ConstantBlock('PushCBV', 1, 0, 2),
+    ]
+    refl.samplers = [rd.ShaderSampler('Samplers', 2048)]
+    cap.reflection = refl
+
+    base_address = 0x1000000000
+    cap.buffers = [ rd.BufferDescription(rd.ResourceId(10000 + i), buffer_size, base_address + i * 2 * buffer_size)
+                    for i in range(buffers) ]
+    # Legacy offset buffer, four words per heap entry, texel buffer first element and count in the last two.
+    offset_buffer_size = 16 * (descriptors + 1)
+    offset_buffer_table = array.array('I', [0, 0, 1, 0x100 // 4 - 2]) * (descriptors + 1)
+    cap.offset_buffer_id = rd.ResourceId(10000 + buffers)
+    cap.offset_buffer_data = offset_buffer_table.tobytes()
+    cap.buffers.append(rd.BufferDescription(cap.offset_buffer_id, offset_buffer_size, base_address - 2 * offset_buffer_size))
+    cap.buffers_by_id = { b.resourceId: b for b in cap.buffers }
+
+    R32 = rd.ResourceFormat('R32_UINT', 4)
+    RGBA8 = rd.ResourceFormat('R8G8B8A8_UNORM', 4)
+    RGBA8S = rd.ResourceFormat('R8G8B8A8_SRGB', 4)
+    cap.textures = [ rd.TextureDescription(rd.ResourceId(20000 + i), texture_size, texture_size, 1, 1, texture_layers, RGBA8, 2,
+                                           rd.TextureCategory.ShaderRead | rd.TextureCategory.ShaderReadWrite)
+                     for i in range(texture_arrays) ]
+    cap.textures_by_id = { t.resourceId: t for t in cap.textures }
+
+    # Scatter heap entries over buffers so each buffer ends up with several disjoint and overlapping ranges.
+    ro = []
+    rw = []
+    slots_per_buffer = max(1, buffer_size // 0x100)
+    for i in range(descriptors):
+        buf = rd.ResourceId(10000 + (i * 7919) % buffers if buffers else 0)
+        offset = ((i * 31) % slots_per_buffer) * 0x100
+        match i % 10:
+            case 0 | 1 | 2 | 3 | 4:
+                ro.append(used(0, i, type = D.Buffer, resource = buf, byteOffset = offset, byteSize = 0x100))
+            case 5:
+                ro.append(used(2, i, type = D.TypedBuffer, resource = buf, byteOffset = offset, byteSize = 0x100, format = R32))
+            case 6 | 7 if texture_arrays:
+                tex = cap.textures[i % texture_arrays]
+                ro.append(used(1, i, type = D.Image, resource = tex.resourceId, textureType = T.Texture2DArray,
+                               firstSlice = (i // texture_arrays) % texture_layers, numSlices = 1,
+                               format = RGBA8S if i & 1 else RGBA8))
+            case 8:
+                rw.append(used(0, i, type = D.ReadWriteBuffer, resource = buf, byteOffset = offset, byteSize = 0x100))
+            case _:
+                rw.append(used(2, i, type = D.ReadWriteTypedBuffer, resource = buf, byteOffset = offset, byteSize = 0x100, format = R32))
+    # Null descriptors are common in real heaps.
+    ro.append(used(0, descriptors, type = D.Buffer, resource = rd.ResourceId(0)))
+    if texture_arrays:
+        rw.append(used(4, 0, type = D.ReadWriteImage, resource = cap.textures[0].resourceId,
+                       textureType = T.Texture2DArray, numSlices = texture_layers, format = R32))
+    if offset_buffer:
+        rw.append(used(3, 0, type = D.ReadWriteBuffer, resource = cap.offset_buffer_id, byteOffset = 0, byteSize = offset_buffer_size))
+    cap.ro = ro
+    cap.rw = rw
+
+    first_buffer = rd.ResourceId(10000 if buffers else 0)
+    cap.cbv = [ used(0, 600 + i, type = D.ConstantBuffer, resource = first_buffer, byteOffset = 0x100 * i, byteSize = 0x100)
+                for i in range(16) ]
+    cap.cbv.append(used(1, 0, type = D.ConstantBuffer, resource = first_buffer, byteOffset = 0, byteSize = 0x100))
+
+    cap.samplers = [ rd.UsedDescriptor(rd.DescriptorAccess(0, i), None, rd.SamplerDescriptor()) for i in range(64) ]
+    cap.samplers.append(rd.UsedDescriptor(rd.DescriptorAccess(0, 64), None, rd.SamplerDescriptor(True)))
+
+    push = array.array('I', [0] * 16)
+    push[0] = 1000
+    push[1] = 16
+    push[2] = 0x3f800000
+    push[3] = 42
+    if buffers:
+        split_bda(push, 4, cap.buffers[buffers // 2].gpuAddress + 0x10)
+        split_bda(push, 6, cap.buffers[buffers // 3].gpuAddress + 0x40)
+        split_bda(push, 8, cap.buffers[buffers - 1].gpuAddress + 0x100)
+    cap.push = push.tobytes()
+
+    action = rd.ActionDescription(cap.eid, (8, 4, 1))
+    cap.root_actions = [ rd.ActionDescription(cap.eid - 1, (0, 0, 0), rd.ActionFlags.NoFlags), action ]
+    cap.actions_by_eid = { a.eventId: a for a in cap.root_actions }
+    return cap
@@ -3,24 +3,35 @@ D3D12 vkd3d-proton exporter - Copyright 2025 Hans-Kristian Arntzen for Valve Cor
 SPDX-Licence-Identifier: MIT
 '''
 
+from __future__ import annotations
 from typing import Optional
-import qrenderdoc as qrd
 import renderdoc as rd
+try:
+    import qrenderdoc as qrd
+except ImportError:
+    # Running headless through the renderdoc module, see __main__.py.
+    qrd = None
 import os
 import json
-import sys
 import array
 import shutil
-
-def extract_string(tokenstr):
-    s = ''
-    for c in tokenstr:
-        for i in range(4):
-            shifted = (c >> (8 * i)) & 0xff
-            if shifted == 0:
-                break
-            s += chr(shifted)
-    return s
+import functools
+import bisect
+import collections
+import heapq
+import threading
+import queue
+import hashlib
+import zlib
+import lzma
+import mmap
+import pickle
+import struct
+import time
+
+def extract_string(tokens):
+    # Literal strings are nul-terminated and packed little-endian into words, so decode in one go.
+    return tokens.tobytes().split(b'\0', 1)[0].decode('utf-8', errors = 'replace')
 
 class spv:
     OpTypeInt = 21
@@ -29,9 +40,32 @@ class spv:
     OpString = 7
     OpConstant = 43
 
-def parse_spirv_resources(bytes):
-    token_array = [x for x in array.array('I', bytes)]
-    token_array = token_array[5:]
+# Everything else is skipped by length alone.
+spv_interesting_opcodes = frozenset([spv.OpTypeInt, spv.OpExtInstImport, spv.OpExtInst, spv.OpString, spv.OpConstant])
+
+# The same shader is very commonly used by many dispatches, and reparsing large modules is not free.
+# Keyed on a digest of the SPIR-V, so it is safe across captures without keeping the modules themselves alive.
+spirv_resource_cache = collections.OrderedDict()
+spirv_resource_cache_size = 128
+spirv_resource_cache_lock = threading.Lock()
+
+def parse_spirv_resources(spirv):
+    key = hashlib.sha256(spirv).digest()
+    with spirv_resource_cache_lock:
+        cached = spirv_resource_cache.get(key)
+        if cached is not None:
+            spirv_resource_cache.move_to_end(key)
+            return cached
+    result = scan_spirv_resources(spirv)
+    with spirv_resource_cache_lock:
+        spirv_resource_cache[key] = result
+        while len(spirv_resource_cache) > spirv_resource_cache_size:
+            spirv_resource_cache.popitem(last = False)
+    return result
+
+def scan_spirv_resources(spirv):
+    tokens = memoryview(spirv).cast('I')
+    token_count = len(tokens)
 
     constants = dict()
     strings = dict()
@@ -40,46 +74,59 @@ def parse_spirv_resources(bytes):
 
     resources = []
     name = 'shader.dxil'
-    root_signature_binary = b''
-
-    offset = 0
-    while offset < len(token_array):
-        opcode : int = token_array[offset] & 0xffff
-        oplen = token_array[offset] >> 16
-        args = token_array[offset + 1 : offset + oplen]
-        offset += oplen
+    root_signature_binary = bytearray()
+
+    offset = 5
+    while offset < token_count:
+        word : int = tokens[offset]
+        opcode = word & 0xffff
+        oplen = word >> 16
+        if oplen == 0:
+            print('Malformed SPIR-V, stopping parse.')
+            break
+
+        arg = offset + 1
+        end = min(offset + oplen, token_count)
+        offset = end
+
+        if opcode not in spv_interesting_opcodes:
+            continue
+
         match opcode:
             case spv.OpTypeInt:
-                int_types[args[0]] = args[1]
+                int_types[tokens[arg]] = tokens[arg + 1]
             case spv.OpString:
-                s = extract_string(args[1:])
+                s = extract_string(tokens[arg + 1 : end])
                 if s.endswith('.dxil') or s.endswith('.dxbc'):
                     name = s
                 else:
-                    strings[args[0]] = s
+                    strings[tokens[arg]] = s
             case spv.OpConstant:
-                if args[0] in int_types:
-                    constants[args[1]] = (args[0], args[2])
+                if tokens[arg] in int_types:
+                    constants[tokens[arg + 1]] = (tokens[arg], tokens[arg + 2])
             case spv.OpExtInstImport:
-                if extract_string(args[1:]) == 'NonSemantic.dxil-spirv.signature':
-                    nonsemantic = args[0]
+                if extract_string(tokens[arg + 1 : end]) == 'NonSemantic.dxil-spirv.signature':
+                    nonsemantic = tokens[arg]
             case spv.OpExtInst:
-                if args[2] == nonsemantic and args[3] == 0:
-                    kind = strings[args[4]]
-                    index = constants[args[5]][1]
-                    pushoffset = constants[args[6]][1]
-                    pushsize = constants[args[7]][1]
+                if tokens[arg + 2] != nonsemantic:
+                    continue
+                instruction = tokens[arg + 3]
+                if instruction == 0:
+                    kind = strings[tokens[arg + 4]]
+                    index = constants[tokens[arg + 5]][1]
+                    pushoffset = constants[tokens[arg + 6]][1]
+                    pushsize = constants[tokens[arg + 7]][1]
                     resources.append((kind, index, pushoffset, pushsize))
-                elif args[2] == nonsemantic and args[3] == 1:
-                    if strings[args[4]] == 'RootSignature':
-                        args = args[5:]
-                        for arg in args:
-                            c = constants[arg]
+                elif instruction == 1:
+                    if strings[tokens[arg + 4]] == 'RootSignature':
+                        for i in range(arg + 5, end):
+                            c = constants[tokens[i]]
                             value : int = c[1]
                             bitwidth = int_types[c[0]]
                             root_signature_binary += value.to_bytes(bitwidth // 8, byteorder = 'little')
 
-    return resources, name, root_signature_binary
+    # Results are shared between callers through the cache, so hand out immutable data only.
+    return tuple(resources), name, bytes(root_signature_binary)
 
 def is_buffer(desc_type):
     match desc_type:
@@ -257,6 +304,8 @@ def view_type_has_cube_range(view_type, uav):
     return view_type == rd.TextureType.TextureCubeArray
 
 class BufferRange():
+    __slots__ = ('start_offset', 'end_offset', 'ro', 'rw', 'name', 'path')
+
     def __init__(self, start, end):
         self.start_offset = start
         self.end_offset = end
@@ -266,18 +315,37 @@ class BufferRange():
         self.path = ''
 
 class BufferState():
+    __slots__ = ('ranges', 'starts', 'resource')
+
     def __init__(self, res):
+        # Disjoint ranges sorted by start offset, with the start offsets mirrored for bisection.
         self.ranges = []
+        self.starts = []
         self.resource = res
 
     def add_accessed_range(self, start, end, is_uav):
-        existing = self.find_overlapping_range(start, end)
-        if existing:
-            existing.start_offset = min(existing.start_offset, start)
-            existing.end_offset = max(existing.end_offset, end)
+        # Fold every range overlapping [start, end) into one, a new range can bridge several existing ones.
+        first = bisect.bisect_right(self.starts, start) - 1
+        if first >= 0 and self.ranges[first].end_offset > start:
+            last = max(bisect.bisect_left(self.starts, end), first + 1)
         else:
+            first += 1
+            last = bisect.bisect_left(self.starts, end)
+
+        if first == last:
             existing = BufferRange(start, end)
-            self.ranges.append(existing)
+            self.ranges.insert(first, existing)
+            self.starts.insert(first, start)
+        else:
+            existing = self.ranges[first]
+            existing.start_offset = min(existing.start_offset, start)
+            existing.end_offset = max(self.ranges[last - 1].end_offset, end)
+            for buf_range in self.ranges[first + 1 : last]:
+                existing.ro = existing.ro or buf_range.ro
+                existing.rw = existing.rw or buf_range.rw
+            del self.ranges[first + 1 : last]
+            del self.starts[first + 1 : last]
+            self.starts[first] = existing.start_offset
 
         if is_uav:
             existing.rw = True
@@ -287,52 +355,1169 @@ class BufferState():
     def align(self):
         # Core buffer alignment is 64 KiB in D3D12 (without the very latest AgilitySDK)
         # Need this to ensure that alignments for raw buffers work out.
+        # Aligning down keeps the ranges sorted, but can make neighbours overlap again, so re-merge.
+        merged = []
         for buf_range in self.ranges:
             buf_range.start_offset = buf_range.start_offset & ~0xffff
+            if merged and buf_range.start_offset < merged[-1].end_offset:
+                prev = merged[-1]
+                prev.end_offset = max(prev.end_offset, buf_range.end_offset)
+                prev.ro = prev.ro or buf_range.ro
+                prev.rw = prev.rw or buf_range.rw
+            else:
+                merged.append(buf_range)
+        self.ranges = merged
+        self.starts = [buf_range.start_offset for buf_range in merged]
+
+    def find_containing_range(self, offset):
+        i = bisect.bisect_right(self.starts, offset) - 1
+        if i >= 0 and offset < self.ranges[i].end_offset:
+            return self.ranges[i]
+        return None
 
     def find_overlapping_range(self, start, end):
-        for buf_range in self.ranges:
-            if start < buf_range.end_offset and end > buf_range.start_offset:
-                return buf_range
+        i = bisect.bisect_right(self.starts, start) - 1
+        if i >= 0 and start < self.ranges[i].end_offset:
+            return self.ranges[i]
+        i += 1
+        if i < len(self.ranges) and end > self.ranges[i].start_offset:
+            return self.ranges[i]
         return None
 
     def find_matching_range(self, offset, is_uav):
-        for buf_range in self.ranges:
-            if offset >= buf_range.start_offset and offset < buf_range.end_offset:
-                if (is_uav and buf_range.rw) or (not is_uav and buf_range.ro):
-                    return buf_range
+        buf_range = self.find_containing_range(offset)
+        if buf_range and ((is_uav and buf_range.rw) or (not is_uav and buf_range.ro)):
+            return buf_range
         return None
 
 class TextureState():
+    __slots__ = ('formats', 'cast_formats', 'ro', 'rw', 'name', 'paths', 'resource', 'desc', 'subresources')
+
     def __init__(self, res):
+        # View formats while analyzing, the D3D12 names end up in cast_formats once planned.
         self.formats = []
-        self.base_format = None
+        self.cast_formats = []
         self.ro = False
         self.rw = False
         self.name = ''
         self.paths = []
         self.resource = res
         self.desc = None
+        # mip -> set of array slices referenced by any view
+        self.subresources = {}
 
     def add_view_format(self, fmt):
         if fmt not in self.formats:
             self.formats.append(fmt)
 
+    def add_view_subresources(self, first_mip, num_mips, first_slice, num_slices):
+        for mip in range(first_mip, first_mip + num_mips):
+            if mip not in self.subresources:
+                self.subresources[mip] = set()
+            self.subresources[mip].update(range(first_slice, first_slice + num_slices))
+
+    def referenced_slices(self, mip):
+        # Views can report more than exists, e.g. "all remaining" ranges, so clamp to the actual resource.
+        slices = self.subresources.get(mip)
+        if not slices:
+            return []
+        return sorted(x for x in slices if x < self.desc.arraysize)
+
+# Descriptor classification bits. Type bits come from descriptor_type_class(),
+# the rest depend on the binding and the descriptor itself.
+DESC_BUFFER = 0x1
+DESC_IMAGE = 0x2
+DESC_UAV = 0x4
+DESC_TYPED = 0x8
+DESC_NULL = 0x10
+# Binding name contains SRV, i.e. a UAV descriptor which vkd3d-proton wants viewed as an SRV.
+DESC_FORCE_SRV = 0x20
+DESC_UAV_VIEW = 0x40
+
+descriptor_type_classes = {}
+
+def descriptor_type_class(desc_type):
+    cls = descriptor_type_classes.get(desc_type)
+    if cls is None:
+        cls = ((DESC_BUFFER if is_buffer(desc_type) else 0) |
+               (DESC_IMAGE if is_image(desc_type) else 0) |
+               (DESC_UAV if is_uav(desc_type) else 0) |
+               (DESC_TYPED if is_typed(desc_type) else 0))
+        descriptor_type_classes[desc_type] = cls
+    return cls
+
+class DescriptorTable():
+    '''
+    Bindless SRV/UAV descriptors used by a dispatch, materialized once into columns.
+    Analysis and emission walk the columns instead of the renderdoc objects, so descriptor types
+    and reflection bindings are only classified once per descriptor.
+    '''
+    def __init__(self):
+        self.flags = array.array('B')
+        self.heap_offsets = array.array('I')
+        # Index into bindings, readOnlyResources followed by readWriteResources.
+        self.binding_indices = array.array('I')
+        self.offsets = array.array('Q')
+        self.sizes = array.array('Q')
+        # ResourceId and ResourceFormat are opaque objects, formats are only kept for typed views.
+        self.resources = []
+        self.formats = []
+        # Full descriptors are only kept for images, views need mip and slice ranges.
+        self.image_descriptors = {}
+        self.bindings = []
+        # UAV counter detection, only works with AMD-style embedded layout for now.
+        self.counter_candidates = {}
+        self.raw_buffer_heap_offsets = set()
+
+    def __len__(self):
+        return len(self.flags)
+
+    def build(self, reflection : rd.ShaderReflection, ro, rw):
+        self.bindings = [ res.name for res in reflection.readOnlyResources ] + [ res.name for res in reflection.readWriteResources ]
+        rw_base = len(reflection.readOnlyResources)
+        binding_flags = [ DESC_FORCE_SRV if 'SRV' in name else 0 for name in self.bindings ]
+        bindless = [ res.bindArraySize != 1 for res in reflection.readOnlyResources ] + \
+                   [ res.bindArraySize != 1 for res in reflection.readWriteResources ]
+
+        for used, is_rw_list in [(ro, False), (rw, True)]:
+            for r in used:
+                desc = r.descriptor
+                heap_offset = r.access.arrayElement
+                flags = descriptor_type_class(desc.type)
+
+                if is_rw_list and (flags & DESC_BUFFER):
+                    if flags & DESC_TYPED:
+                        if desc.byteSize == 4 and desc.format.Name() == 'R32_UINT':
+                            self.counter_candidates[heap_offset] = (desc.resource, desc.byteOffset)
+                    else:
+                        self.raw_buffer_heap_offsets.add(heap_offset)
+
+                binding = r.access.index + (rw_base if flags & DESC_UAV else 0)
+                if not bindless[binding]:
+                    continue
+
+                flags |= binding_flags[binding]
+                if (flags & DESC_UAV) and not (flags & DESC_FORCE_SRV):
+                    flags |= DESC_UAV_VIEW
+                if desc.resource == 0:
+                    flags |= DESC_NULL
+                if flags & DESC_IMAGE:
+                    self.image_descriptors[len(self.flags)] = desc
+
+                self.flags.append(flags)
+                self.heap_offsets.append(heap_offset)
+                self.binding_indices.append(binding)
+                self.offsets.append(desc.byteOffset)
+                self.sizes.append(desc.byteSize)
+                self.resources.append(desc.resource)
+                self.formats.append(desc.format if flags & DESC_TYPED else None)
+        return self
+
+def unlink_existing(path):
+    # Export files can be hardlinks into a blob store, writing through one would corrupt the stored blob.
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def open_new_file(path, mode):
+    unlink_existing(path)
+    return open(path, mode)
+
+def atomic_write(path, writer):
+    # writer creates the file at the temporary path it is given, which then replaces path as a whole,
+    # so concurrent exports never observe a partial file.
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        writer(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 def dump_binary_to_file(path, binary_data):
-    with open(path, 'wb') as f:
+    with open_new_file(path, 'wb') as f:
         f.write(binary_data)
 
-def lookup_bda(ctx : qrd.CaptureContext, bda, max_size):
-    buffers : List[rd.BufferDescription] = ctx.GetBuffers()
-    for buf in buffers:
-        if bda >= buf.gpuAddress and bda < buf.gpuAddress + buf.length:
-            avail_len = buf.gpuAddress + buf.length - bda
-            avail_len = min(avail_len, max_size)
-            return buf.resourceId, bda - buf.gpuAddress, avail_len
-    return 0, 0, 0
+blob_compression_suffixes = { 'zlib' : '.zlib', 'lzma' : '.xz' }
 
-def write_output_u32(out_object, in_bytes):
-    out_object = array.array('I', in_bytes)
+def create_compressor(compression):
+    match compression:
+        case 'zlib':
+            return zlib.compressobj(6)
+        case 'lzma':
+            return lzma.LZMACompressor(lzma.FORMAT_XZ)
+        case _:
+            return None
+
+class BlobFile():
+    # Streams one blob to disk, optionally compressing it chunk by chunk.
+    chunk_size = 4 * 1024 * 1024
+
+    def __init__(self, output, path):
+        self.output = output
+        self.path = path
+        self.f = None
+        self.compressor = None
+        self.offset = 0
+
+    def begin(self, first_data):
+        compression = self.output.compression
+        if compression and len(first_data) > 0:
+            # Sample the start of the blob and leave it raw if it doesn't compress well.
+            sample = first_data[:1024 * 1024]
+            if len(zlib.compress(sample, 1)) > self.output.threshold * len(sample):
+                compression = None
+        self.compressor = create_compressor(compression) if compression else None
+        path = self.path + blob_compression_suffixes[compression] if self.compressor else self.path
+        self.output.written[self.path] = (path, compression if self.compressor else None)
+        self.f = open_new_file(os.path.join(self.output.dir_path, path), 'wb')
+
+    def write(self, data):
+        data = memoryview(data).cast('B')
+        with self.output.profiler.scope('BlobFile.write', 'disk') as scope:
+            if self.f is None:
+                self.begin(data)
+            if self.compressor:
+                for i in range(0, len(data), self.chunk_size):
+                    self.f.write(self.compressor.compress(data[i : i + self.chunk_size]))
+            else:
+                self.f.write(data)
+            scope.bytes_written = len(data)
+        self.offset += len(data)
+
+    def pad_to(self, offset):
+        # Skipped regions read back as zero. Raw files just get holes.
+        if offset <= self.offset:
+            return
+        if self.f is None:
+            self.begin(memoryview(b''))
+        if self.compressor:
+            zeros = bytes(min(self.chunk_size, offset - self.offset))
+            while self.offset < offset:
+                n = min(len(zeros), offset - self.offset)
+                self.f.write(self.compressor.compress(zeros[:n]))
+                self.offset += n
+        else:
+            self.f.seek(offset)
+            self.offset = offset
+
+    def close(self, total_size = 0):
+        if self.f is None:
+            self.begin(memoryview(b''))
+        self.pad_to(total_size)
+        if self.compressor:
+            self.f.write(self.compressor.flush())
+        else:
+            # A trailing hole is not materialized by seeking alone.
+            self.f.truncate(self.offset)
+        self.f.close()
+
+class MappedBlob():
+    # Raw blob preallocated to its final size. Pieces are copied straight into place in any order,
+    # and the blob is closed once all of them have arrived.
+    def __init__(self, output, path, size, pieces):
+        self.output = output
+        self.lock = threading.Lock()
+        self.remaining = pieces
+        self.f = open_new_file(os.path.join(output.dir_path, path), 'w+b')
+        # Preallocation is sparse, pieces which never arrive read back as zero.
+        self.f.truncate(size)
+        self.map = mmap.mmap(self.f.fileno(), size) if size > 0 else None
+        output.written[path] = (path, None)
+
+    def write(self, offset, data):
+        data = memoryview(data).cast('B')
+        # Empty blobs have nothing to map, GetTextureData can return no data at all.
+        if len(data) > 0 and self.map is not None:
+            with self.output.profiler.scope('MappedBlob.write', 'disk') as scope:
+                self.map[offset : offset + len(data)] = data
+                scope.bytes_written = len(data)
+        with self.lock:
+            self.remaining -= 1
+            done = self.remaining == 0
+        if done:
+            self.close()
+
+    def close(self):
+        with self.lock:
+            if self.f is None:
+                return
+            if self.map is not None:
+                self.map.close()
+            self.f.close()
+            self.f = None
+
+class BlobOutput():
+    def __init__(self, dir_path, options, profiler : ExportProfiler):
+        self.dir_path = dir_path
+        self.profiler = profiler
+        self.compression = options.compression
+        self.threshold = options.compression_threshold
+        # path -> (path on disk, compression or None)
+        self.written = {}
+
+    def open(self, path, size = 0):
+        return BlobFile(self, path)
+
+    def can_map(self):
+        # Compressed blobs have to be streamed in order.
+        return not self.compression
+
+    def map(self, path, size, pieces):
+        return MappedBlob(self, path, size, pieces)
+
+    def resolve(self, path):
+        return self.written.get(path, (path, None))
+
+    def finish(self):
+        pass
+
+    def close(self):
+        pass
+
+# Packed archive, all blobs of an export in one file:
+#   header: magic, version, entry count, table offset (u64)
+#   payloads, each aligned so they can be used straight from a mapping of the whole file
+#   table: per entry offset (u64), size (u64), name length (u32), UTF-8 name
+archive_magic = b'RDXPACK\0'
+archive_version = 1
+archive_header = struct.Struct('<8sIIQ')
+archive_entry = struct.Struct('<QQI')
+
+def archive_alignment(size):
+    return 4096 if size >= 64 * 1024 else 256
+
+class ArchiveRegion():
+    # Blob reserved in the archive, written in place. Writers share the archive's file position, see ArchiveOutput.write_at.
+    def __init__(self, archive, path, offset, capacity):
+        self.archive = archive
+        self.path = path
+        self.base = offset
+        self.capacity = capacity
+        self.offset = 0
+        self.size = 0
+
+    def write_at(self, offset, data):
+        data = memoryview(data).cast('B')
+        if offset + len(data) > self.capacity:
+            raise ExportError(f'{self.path} is larger than its reserved space in the archive')
+        with self.archive.profiler.scope('ArchiveRegion.write', 'disk') as scope:
+            self.archive.write_at(self.base + offset, data)
+            scope.bytes_written = len(data)
+        self.size = max(self.size, offset + len(data))
+
+    # Same interface as BlobFile for streamed blobs.
+    def write(self, data):
+        self.write_at(self.offset, data)
+        self.offset += len(memoryview(data).cast('B'))
+
+    def pad_to(self, offset):
+        self.offset = max(self.offset, offset)
+
+    def close(self, total_size = 0):
+        self.size = max(self.size, self.offset, total_size)
+
+class ArchiveOutput():
+    # Drop-in for BlobOutput which reserves space for blobs in one archive instead of writing files.
+    # Space is handed out in order, so the archive is written front to back.
+    file_name = 'capture.pack'
+
+    def __init__(self, dir_path, profiler : ExportProfiler):
+        self.dir_path = dir_path
+        self.profiler = profiler
+        self.compression = ''
+        self.lock = threading.Lock()
+        self.regions = {}
+        self.end = archive_header.size
+        self.f = open_new_file(os.path.join(dir_path, self.file_name), 'w+b')
+        # os.pwrite is not available on Windows, so seeks and writes happen under a lock instead.
+        self.file_lock = threading.Lock()
+
+    def write_at(self, offset, data):
+        with self.file_lock:
+            self.f.seek(offset)
+            self.f.write(data)
+
+    def reserve(self, path, size):
+        with self.lock:
+            alignment = archive_alignment(size)
+            offset = (self.end + alignment - 1) & ~(alignment - 1)
+            self.end = offset + size
+            region = ArchiveRegion(self, path, offset, size)
+            self.regions[path] = region
+            return region
+
+    def open(self, path, size = 0):
+        return self.reserve(path, size)
+
+    def can_map(self):
+        return True
+
+    def map(self, path, size, pieces):
+        region = self.reserve(path, size)
+        region.size = size
+        return MappedArchiveRegion(region)
+
+    def resolve(self, path):
+        return (path, None)
+
+    def locate(self, path):
+        region = self.regions.get(path)
+        return [region.base, region.size] if region else None
+
+    def finish(self):
+        # Table goes last, only then are all sizes known.
+        table = bytearray()
+        for path, region in self.regions.items():
+            name = path.encode('utf-8')
+            table += archive_entry.pack(region.base, region.size, len(name)) + name
+        table_offset = (self.end + 7) & ~7
+        self.write_at(table_offset, table)
+        self.write_at(0, archive_header.pack(archive_magic, archive_version, len(self.regions), table_offset))
+        self.f.truncate(table_offset + len(table))
+        self.f.close()
+
+    def close(self):
+        self.f.close()
+
+class MappedArchiveRegion():
+    # MappedBlob interface for SubresourceWriter, pieces land at their offset in any order.
+    def __init__(self, region : ArchiveRegion):
+        self.region = region
+
+    def write(self, offset, data):
+        self.region.write_at(offset, data)
+
+    def close(self):
+        pass
+
+def read_archive_index(path):
+    # name -> (offset, size)
+    index = {}
+    with open(path, 'rb') as f:
+        magic, version, count, table_offset = archive_header.unpack(f.read(archive_header.size))
+        if magic != archive_magic or version != archive_version:
+            raise ExportError(f'{path} is not a version {archive_version} export archive')
+        f.seek(table_offset)
+        for _ in range(count):
+            offset, size, name_length = archive_entry.unpack(f.read(archive_entry.size))
+            index[f.read(name_length).decode('utf-8')] = (offset, size)
+    return index
+
+class BufferReadBatch():
+    def __init__(self):
+        # resource -> [(offset, length, path)]
+        self.reads = {}
+
+    def add(self, resource, offset, length, path):
+        if resource not in self.reads:
+            self.reads[resource] = []
+        self.reads[resource].append((offset, length, path))
+
+    def build_spans(self):
+        # Overlapping or adjacent reads of the same resource are fused into one GetBufferData call
+        # which is then split up again.
+        spans = []
+        for resource, reads in self.reads.items():
+            reads.sort(key = lambda read : read[0])
+            resource_spans = []
+            for read in reads:
+                if resource_spans and read[0] <= resource_spans[-1][1]:
+                    span = resource_spans[-1]
+                    span[1] = max(span[1], read[0] + read[1])
+                    span[2].append(read)
+                else:
+                    resource_spans.append([read[0], read[0] + read[1], [read]])
+            spans += [ (resource, span[0], span[1], span[2]) for span in resource_spans ]
+        return spans
+
+    def total_bytes(self):
+        return sum(end - start for _, start, end, _ in self.build_spans())
+
+    def execute(self, replayer : rd.ReplayController, output : BlobOutput, progress : ExportProgress, chunk_size):
+        # Runs on the replay thread. Spans are read in chunks which are streamed into every blob they overlap,
+        # so peak memory stays at one chunk no matter how large a buffer range is.
+        for resource, start, end, span_reads in self.build_spans():
+            if progress.cancelled():
+                return
+            self.execute_span(replayer, output, progress, chunk_size, resource, start, end, span_reads)
+
+    def execute_span(self, replayer : rd.ReplayController, output : BlobOutput, progress : ExportProgress, chunk_size,
+                     resource, start, end, span_reads):
+        # Reads are sorted by offset, blobs are opened when the first chunk reaches them.
+        next_read = 0
+        active = {}
+        try:
+            for chunk_start in range(start, end, chunk_size):
+                if progress.cancelled():
+                    return
+                chunk_end = min(end, chunk_start + chunk_size)
+                with output.profiler.scope('GetBufferData') as scope:
+                    data = memoryview(replayer.GetBufferData(resource, chunk_start, chunk_end - chunk_start))
+                    scope.bytes_read = len(data)
+
+                while next_read < len(span_reads) and span_reads[next_read][0] < chunk_end:
+                    offset, length, path = span_reads[next_read]
+                    active[path] = (offset, offset + length, output.open(path, length))
+                    next_read += 1
+
+                for path, (read_start, read_end, f) in list(active.items()):
+                    lo = max(read_start, chunk_start)
+                    hi = min(read_end, chunk_end)
+                    if lo < hi:
+                        f.write(data[lo - chunk_start : hi - chunk_start])
+                    if read_end <= chunk_end:
+                        f.close()
+                        del active[path]
+                progress.advance(chunk_end - chunk_start)
+
+            # Empty reads are never reached by a chunk, but still get an (empty) blob.
+            for offset, length, path in span_reads[next_read:]:
+                output.open(path).close()
+        finally:
+            # Reads past the end of the buffer come back short, and cancelling leaves blobs half written.
+            for _, _, f in active.values():
+                f.close()
+
+class BufferAddressIndex():
+    def __init__(self, buffers):
+        # Buffers can alias each other (placed resources). Split the address space at every buffer
+        # start and end, and resolve which buffer owns each piece up front so lookups are one bisection.
+        # If multiple buffers contain an address, prefer the one RenderDoc lists first.
+        entries = []
+        for i, buf in enumerate(buffers):
+            buf : rd.BufferDescription
+            if buf.gpuAddress == 0 or buf.length == 0:
+                continue
+            entries.append((buf.gpuAddress, buf.gpuAddress + buf.length, i, buf.resourceId))
+        entries.sort(key = lambda entry: entry[0])
+
+        self.starts = [entry[0] for entry in entries]
+        self.ends = [entry[1] for entry in entries]
+        self.resources = [entry[3] for entry in entries]
+
+        # Piece k covers [bounds[k], bounds[k + 1]) and is owned by owners[k], or -1 in gaps.
+        self.bounds = []
+        self.owners = []
+        points = sorted(set(self.starts) | set(self.ends))
+        active = []
+        j = 0
+        for point in points:
+            while j < len(entries) and entries[j][0] == point:
+                heapq.heappush(active, (entries[j][2], j))
+                j += 1
+            # Lazily drop buffers which ended, only the highest priority one matters.
+            while active and self.ends[active[0][1]] <= point:
+                heapq.heappop(active)
+            owner = active[0][1] if active else -1
+            if self.owners and self.owners[-1] == owner:
+                continue
+            self.bounds.append(point)
+            self.owners.append(owner)
+
+    def lookup(self, bda, max_size):
+        k = bisect.bisect_right(self.bounds, bda) - 1
+        found = self.owners[k] if k >= 0 else -1
+        if found < 0:
+            return 0, 0, 0
+
+        avail_len = min(self.ends[found] - bda, max_size)
+        return self.resources[found], bda - self.starts[found], avail_len
+
+class CaptureCache():
+    # Works with both qrd.CaptureContext and rd.ReplayController, they share GetBuffers() and GetTextures().
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.buffer_address_index = None
+        self.textures = None
+        self.resource_ids = None
+
+    def get_buffer_address_index(self):
+        if self.buffer_address_index is None:
+            self.buffer_address_index = BufferAddressIndex(self.ctx.GetBuffers())
+        return self.buffer_address_index
+
+    def get_texture(self, resource) -> Optional[rd.TextureDescription]:
+        if self.textures is None:
+            self.textures = { tex.resourceId : tex for tex in self.ctx.GetTextures() }
+        return self.textures.get(resource)
+
+    def get_resource_id(self, value) -> Optional[rd.ResourceId]:
+        # ResourceId can't be constructed from Python, so map persisted ids back through the resource lists.
+        if self.resource_ids is None:
+            self.resource_ids = { int(res.resourceId) : res.resourceId for res in self.ctx.GetBuffers() }
+            self.resource_ids.update({ int(res.resourceId) : res.resourceId for res in self.ctx.GetTextures() })
+        return self.resource_ids.get(value)
+
+if qrd is not None:
+    class CaptureCacheTracker(qrd.CaptureViewer):
+        def __init__(self, ctx : qrd.CaptureContext):
+            super().__init__()
+            self.ctx = ctx
+
+        def OnCaptureLoaded(self):
+            invalidate_capture_cache()
+
+        def OnCaptureClosed(self):
+            invalidate_capture_cache()
+
+        def OnSelectedEventChanged(self, event):
+            pass
+
+        def OnEventChanged(self, event):
+            schedule_speculative_plan(self.ctx, event)
+
+capture_cache : Optional[CaptureCache] = None
+capture_cache_tracker : Optional[CaptureCacheTracker] = None
+# Plan precomputed on the replay thread for the event being browsed, as ((eid, plan key), plan).
+# The plan is None once taken, the key stays so the same event is not analyzed again.
+speculative_plan = None
+speculative_source = None
+# Latest event a plan was scheduled for, runs for earlier events are stale.
+speculative_eid = None
+# Exports move the replay around themselves, that is not browsing.
+export_in_progress = False
+
+def get_capture_cache(ctx : qrd.CaptureContext):
+    global capture_cache
+    if capture_cache is None:
+        capture_cache = CaptureCache(ctx)
+    return capture_cache
+
+def invalidate_capture_cache():
+    global capture_cache, speculative_plan, speculative_source, speculative_eid
+    capture_cache = None
+    speculative_plan = None
+    speculative_source = None
+    speculative_eid = None
+
+def schedule_speculative_plan(ctx : qrd.CaptureContext, eid):
+    global speculative_eid
+    options = ExportOptions()
+    if not options.speculative or export_in_progress:
+        return
+    action = ctx.GetAction(eid)
+    if action is None or not (action.flags & rd.ActionFlags.Dispatch):
+        return
+    key = (eid, options.plan_key())
+    if speculative_plan is not None and speculative_plan[0] == key:
+        return
+    # The CaptureContext belongs to the UI thread, so everything run needs from it is read here.
+    speculative_eid = eid
+    capture_path = ctx.GetCaptureFilename()
+
+    def run(controller : rd.ReplayController):
+        global speculative_plan, speculative_source
+        # Browsing moved on before we got to run, the replay is no longer at this event.
+        if speculative_eid != eid:
+            return
+        if speculative_source is None or speculative_source.controller is not controller:
+            # Resource lists come from the controller, the UI's capture cache would read them through the CaptureContext.
+            speculative_source = ReplayExportSource(controller, capture_path = capture_path)
+        try:
+            analysis_log.quiet = True
+            plan = plan_dispatch(speculative_source, eid, options, store = False)
+        except ExportError as e:
+            print(f'Not precomputing export plan for EID {eid}: {e}')
+            return
+        finally:
+            analysis_log.quiet = False
+        speculative_plan = (key, plan)
+        print(f'Precomputed export plan for EID {eid}, about {plan.estimated_bytes() / (1024 * 1024):.1f} MiB to dump')
+
+    # Tagged, so only the latest event is analyzed when browsing quickly.
+    ctx.Replay().AsyncInvoke('vkd3d-proton-export-plan', run)
+
+def take_speculative_plan(eid, options):
+    # Handed out once, the plan's profiler ends up recording the export it is used for.
+    global speculative_plan
+    if speculative_plan is not None and speculative_plan[0] == (eid, options.plan_key()):
+        plan = speculative_plan[1]
+        speculative_plan = (speculative_plan[0], None)
+        return plan
+    return None
+
+class SubresourceWriter():
+    def __init__(self, output : BlobOutput, num_threads = 4, max_pending_bytes = 256 * 1024 * 1024):
+        self.output = output
+        self.max_pending_bytes = max_pending_bytes
+        self.pending_bytes = 0
+        self.cond = threading.Condition()
+        self.error = None
+        # Streamed blobs: all subresources of a file go to the same writer in order, so files are written sequentially.
+        self.routes = {}
+        # Mapped blobs: subresources go to any writer and land at their offset directly.
+        self.mapped = {}
+        self.next_queue = 0
+        self.queues = [queue.SimpleQueue() for _ in range(num_threads)]
+        self.threads = [threading.Thread(target = self.worker, args = (q,), daemon = True) for q in self.queues]
+        for thread in self.threads:
+            thread.start()
+
+    def write(self, path, data, offset, last, total_size = 0, pieces = 1):
+        with self.cond:
+            # Backpressure so we don't buffer up the entire capture in memory if the disk is slow.
+            # Always let one write through so that a huge subresource cannot stall forever.
+            while self.pending_bytes > 0 and self.pending_bytes + len(data) > self.max_pending_bytes:
+                self.cond.wait()
+            self.pending_bytes += len(data)
+
+        if self.output.can_map():
+            if path not in self.mapped:
+                self.mapped[path] = self.output.map(path, total_size, pieces)
+            self.queues[self.take_queue()].put((path, data, offset, last, total_size, self.mapped[path]))
+            return
+
+        if path not in self.routes:
+            self.routes[path] = self.take_queue()
+        self.queues[self.routes[path]].put((path, data, offset, last, total_size, None))
+        if last:
+            del self.routes[path]
+
+    def take_queue(self):
+        # Round robin, independent of how many routes are currently open.
+        index = self.next_queue
+        self.next_queue = (self.next_queue + 1) % len(self.queues)
+        return index
+
+    def worker(self, q):
+        files = {}
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            path, data, offset, last, total_size, mapped = item
+            try:
+                if self.error is None and mapped is not None:
+                    mapped.write(offset, data)
+                elif self.error is None:
+                    if path not in files:
+                        files[path] = self.output.open(path)
+                    f = files[path]
+                    f.pad_to(offset)
+                    f.write(data)
+                    if last:
+                        files.pop(path).close(total_size)
+            except Exception as e:
+                self.error = e
+            with self.cond:
+                self.pending_bytes -= len(data)
+                self.cond.notify_all()
+
+        for f in files.values():
+            f.close()
+
+    def finish(self):
+        for q in self.queues:
+            q.put(None)
+        for thread in self.threads:
+            thread.join()
+        # Only left open if the export was cancelled or failed part way.
+        for mapped in self.mapped.values():
+            mapped.close()
+        if self.error is not None:
+            raise self.error
+
+def fetch_texture_data(replayer : rd.ReplayController, reads, writer : SubresourceWriter, progress : ExportProgress, profiler : ExportProfiler):
+    # Runs on the replay thread, the writer takes care of disk I/O.
+    # Slices of a mip are all the same size, so a slice's file offset is implied by the data we get back.
+    for resource, mip, slices, arraysize, path in reads:
+        for layer in slices:
+            if progress.cancelled():
+                return
+            sub = rd.Subresource()
+            sub.mip = mip
+            sub.slice = layer
+            sub.sample = 0
+            with profiler.scope('GetTextureData') as scope:
+                data = replayer.GetTextureData(resource, sub)
+                scope.bytes_read = len(data)
+            writer.write(path, data, layer * len(data), layer == slices[-1], arraysize * len(data), len(slices))
+            progress.advance(len(data))
+
+def hash_file(path, chunk_size = 1024 * 1024):
+    h = hashlib.sha256()
+    chunk = bytearray(chunk_size)
+    view = memoryview(chunk)
+    with open(path, 'rb') as f:
+        while True:
+            n = f.readinto(chunk)
+            if n == 0:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+class BlobStore():
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        # Resources can share blobs (e.g. .ro and .rw views), only ingest them once per export.
+        self.ingested = {}
+
+    def ingest(self, dir_path, path):
+        # Moves a blob into the store and returns the path capture.json should use to reference it.
+        if path in self.ingested:
+            return self.ingested[path]
+
+        local_path = os.path.join(dir_path, path)
+        digest = hash_file(local_path)
+        blob_path = os.path.join(self.store_dir, digest[:2], digest + os.path.splitext(path)[1])
+
+        if os.path.exists(blob_path) and os.path.samefile(local_path, blob_path):
+            # Already linked to the store.
+            self.ingested[path] = path
+            return path
+
+        if os.path.exists(blob_path) and os.path.getsize(blob_path) == os.path.getsize(local_path):
+            os.remove(local_path)
+        else:
+            # Stored blobs are never written in place, a missing or damaged one is replaced as a whole.
+            os.makedirs(os.path.dirname(blob_path), exist_ok = True)
+            atomic_write(blob_path, lambda tmp_path: shutil.move(local_path, tmp_path))
+
+        # Keep the export directory self-contained if the filesystem lets us link to the store.
+        try:
+            os.link(blob_path, local_path)
+            result = path
+        except OSError:
+            try:
+                result = os.path.relpath(blob_path, dir_path)
+            except ValueError:
+                # Different drives on Windows.
+                result = os.path.abspath(blob_path)
+
+        self.ingested[path] = result
+        return result
+
+def lookup_bda(cache : CaptureCache, bda, max_size):
+    return cache.get_buffer_address_index().lookup(bda, max_size)
+
+class ProfileScope():
+    def __init__(self, profiler, name, category):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.record(self.name, self.category, self.start, time.perf_counter(), self.bytes_read, self.bytes_written)
+
+class NullProfileScope():
+    bytes_read = 0
+    bytes_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+null_profile_scope = NullProfileScope()
+
+class ExportProfiler():
+    # Wall time, call counts and bytes moved per phase and per replay / disk call.
+    # Written as a Chrome trace (chrome://tracing, Perfetto) and a summary table next to capture.json.
+    def __init__(self, enabled = False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.events = []
+        # (category, name) -> [calls, seconds, bytes read, bytes written]
+        self.stats = {}
+        self.current_phase = None
+
+    def record(self, name, category, start, end, bytes_read = 0, bytes_written = 0):
+        with self.lock:
+            self.events.append({
+                'name' : name,
+                'cat' : category,
+                'ph' : 'X',
+                'ts' : (start - self.origin) * 1e6,
+                'dur' : (end - start) * 1e6,
+                'pid' : os.getpid(),
+                'tid' : threading.get_ident(),
+                'args' : { 'bytes_read' : bytes_read, 'bytes_written' : bytes_written }
+            })
+            key = (category, name)
+            if key not in self.stats:
+                self.stats[key] = [0, 0.0, 0, 0]
+            stat = self.stats[key]
+            stat[0] += 1
+            stat[1] += end - start
+            stat[2] += bytes_read
+            stat[3] += bytes_written
+
+    def scope(self, name, category = 'replay'):
+        return ProfileScope(self, name, category) if self.enabled else null_profile_scope
+
+    def begin_phase(self, name):
+        # Phases are sequential, beginning one ends the previous.
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.end_phase(now)
+        self.current_phase = (name, now)
+
+    def end_phase(self, now = None):
+        if self.current_phase is not None:
+            self.record(self.current_phase[0], 'phase', self.current_phase[1], now if now else time.perf_counter())
+            self.current_phase = None
+
+    def summary(self):
+        lines = [ f'{"Category":<10} {"Name":<40} {"Calls":>8} {"Total ms":>10} {"Avg ms":>10} {"MiB read":>10} {"MiB written":>12} {"MiB/s":>8}' ]
+        for (category, name), (calls, seconds, bytes_read, bytes_written) in sorted(self.stats.items(), key = lambda x : -x[1][1]):
+            moved = (bytes_read + bytes_written) / (1024 * 1024)
+            throughput = f'{moved / seconds:.1f}' if seconds > 0 and moved > 0 else '-'
+            lines.append(f'{category:<10} {name:<40} {calls:>8} {seconds * 1000:>10.2f} {seconds * 1000 / calls:>10.3f} '
+                         f'{bytes_read / (1024 * 1024):>10.2f} {bytes_written / (1024 * 1024):>12.2f} {throughput:>8}')
+        return '\n'.join(lines)
+
+    def write(self, dir_path):
+        if not self.enabled:
+            return
+        self.end_phase()
+        with self.lock:
+            with open(os.path.join(dir_path, 'profile_trace.json'), 'w') as f:
+                json.dump({ 'traceEvents' : self.events, 'displayTimeUnit' : 'ms' }, f)
+            summary = self.summary()
+        with open(os.path.join(dir_path, 'profile_summary.txt'), 'w') as f:
+            print(summary, file = f)
+        print(summary)
+
+class ExportError(Exception):
+    pass
+
+class ExportCancelled(ExportError):
+    pass
+
+class ExportProgress():
+    # Shared between the export job, the replay thread and the UI.
+    def __init__(self, listener = None):
+        self.phase = ''
+        self.bytes_done = 0
+        self.bytes_total = 0
+        self.listener = listener
+        self.cancel_event = threading.Event()
+
+    def notify(self):
+        if self.listener:
+            self.listener(self)
+
+    def set_phase(self, phase):
+        print(phase)
+        self.phase = phase
+        self.notify()
+
+    def add_total(self, count):
+        self.bytes_total += count
+        self.notify()
+
+    def advance(self, count):
+        self.bytes_done += count
+        self.notify()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancelled():
+            raise ExportCancelled('Export was cancelled')
+
+class UIExportSource():
+    # Everything the exporter needs from RenderDoc, backed by the qrenderdoc UI state.
+    def __init__(self, ctx : qrd.CaptureContext):
+        self.ctx = ctx
+
+    def get_cache(self):
+        return get_capture_cache(self.ctx)
+
+    def capture_path(self):
+        return self.ctx.GetCaptureFilename()
+
+    def get_action(self, eid):
+        return self.ctx.GetAction(eid)
+
+    def vulkan_pipeline_state(self):
+        return self.ctx.CurVulkanPipelineState()
+
+    def pipeline_state(self):
+        return self.ctx.CurPipelineState()
+
+    def set_event(self, eid):
+        self.ctx.SetEventID([], eid, eid)
+
+    def invoke(self, callback):
+        # Exceptions would otherwise be swallowed on the replay thread.
+        results = []
+        errors = []
+        def run(replayer):
+            try:
+                results.append(callback(replayer))
+            except Exception as e:
+                errors.append(e)
+        self.ctx.Replay().BlockInvoke(run)
+        if errors:
+            raise errors[0]
+        return results[0] if results else None
+
+class ReplayExportSource():
+    # Same, but driving a ReplayController directly, for headless use.
+    def __init__(self, controller : rd.ReplayController, cache : Optional[CaptureCache] = None, capture_path = ''):
+        self.controller = controller
+        self.cache = cache if cache else CaptureCache(controller)
+        self.path = capture_path
+        self.actions = {}
+        for action in iterate_actions(controller.GetRootActions()):
+            self.actions[action.eventId] = action
+
+    def get_cache(self):
+        return self.cache
+
+    def capture_path(self):
+        return self.path
+
+    def get_action(self, eid):
+        return self.actions.get(eid)
+
+    def vulkan_pipeline_state(self):
+        return self.controller.GetVulkanPipelineState()
+
+    def pipeline_state(self):
+        return self.controller.GetPipelineState()
+
+    def set_event(self, eid):
+        self.controller.SetFrameEvent(eid, True)
+
+    def invoke(self, callback):
+        return callback(self.controller)
+
+def iterate_actions(actions):
+    for action in actions:
+        yield action
+        yield from iterate_actions(action.children)
+
+class DxilIndex():
+    version = 1
+
+    def __init__(self, path):
+        # Persistent listing of .dxil files under the search roots, keyed by directory.
+        # Walking shader dump trees with millions of files takes minutes, this only stats each directory.
+        self.path = path
+        self.roots = []
+        self.directories = {}
+        self.files = None
+        self.dirty = False
+        try:
+            with open(path, 'r') as f:
+                index = json.load(f)
+            if index.get('Version') == DxilIndex.version:
+                self.roots = index['Roots']
+                self.directories = index['Directories']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def add_root(self, root):
+        root = os.path.abspath(root)
+        if root not in self.roots:
+            self.roots.append(root)
+            self.dirty = True
+
+    def refresh(self, roots):
+        # Adding, removing or renaming an entry updates the mtime of its directory,
+        # so only directories with a different mtime have to be listed again.
+        seen = set()
+        pending = [ os.path.abspath(root) for root in roots ]
+        while pending:
+            dir_path = pending.pop()
+            if dir_path in seen:
+                continue
+            seen.add(dir_path)
+            try:
+                mtime = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                continue
+
+            entry = self.directories.get(dir_path)
+            if entry is None or entry['Mtime'] != mtime:
+                dirs = []
+                files = []
+                try:
+                    with os.scandir(dir_path) as it:
+                        for dir_entry in it:
+                            if dir_entry.is_dir(follow_symlinks = False):
+                                dirs.append(dir_entry.name)
+                            elif dir_entry.name.endswith('.dxil'):
+                                files.append(dir_entry.name)
+                except OSError:
+                    continue
+                entry = { 'Mtime' : mtime, 'Dirs' : dirs, 'Files' : files }
+                self.directories[dir_path] = entry
+                self.dirty = True
+
+            pending.extend(os.path.join(dir_path, d) for d in entry['Dirs'])
+
+        # Directories which were removed, or are no longer under any root.
+        for dir_path in [ d for d in self.directories if d not in seen ]:
+            del self.directories[dir_path]
+            self.dirty = True
+        self.files = None
+
+    def lookup(self, file_name):
+        if self.files is None:
+            self.files = {}
+            for dir_path in sorted(self.directories):
+                for name in self.directories[dir_path]['Files']:
+                    self.files.setdefault(name, os.path.join(dir_path, name))
+        path = self.files.get(file_name)
+        return path if path is not None and os.path.isfile(path) else None
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok = True)
+        def write(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump({ 'Version' : DxilIndex.version, 'Roots' : self.roots, 'Directories' : self.directories }, f)
+        atomic_write(self.path, write)
+        self.dirty = False
+
+def find_dxil(options, file_name, search_dirs = [], remember = False):
+    # Searches the configured roots, roots remembered from earlier searches and search_dirs.
+    # With remember, search_dirs are added to the remembered roots.
+    index = DxilIndex(options.dxil_index)
+    if remember:
+        for search_dir in search_dirs:
+            index.add_root(search_dir)
+    roots = list(dict.fromkeys(index.roots + options.dxil_roots + list(search_dirs)))
+    if not roots:
+        return None
+    index.refresh(roots)
+    try:
+        index.save()
+    except OSError as e:
+        print(f'Failed to save DXIL index {options.dxil_index}: {e}')
+    return index.lookup(file_name)
+
+def read_buffer_u32(replayer : rd.ReplayController, resource, offset, size):
+    # Zero-copy view of the words, a trailing partial word is dropped.
+    data = memoryview(replayer.GetBufferData(resource, offset, size))
+    return data[:len(data) & ~3].cast('I')
+
+def rewrite_texel_buffer_range(offset_buffer, heap_offset, offset, size, element_size):
+    # Rewrite the offset / size to match the offset buffer values.
+    # Ignore offset buffer for SSBO since no driver should hit that path anymore.
+    index = 4 * heap_offset
+    if offset_buffer is None or index + 3 >= len(offset_buffer):
+        return offset, size
+    return offset + element_size * offset_buffer[index + 2], element_size * offset_buffer[index + 3]
 
 def to_d3d12_format(fmt : rd.ResourceFormat, is_depth):
     match fmt.type:
@@ -368,47 +1553,418 @@ def to_d3d12_pixel_size(fmt : rd.ResourceFormat):
         case _:
             return fmt.ElementSize()
 
-def export_callback(ctx : qrd.CaptureContext, data):
-    print('Trying to export ...')
-    eid = ctx.CurEvent()
-    print('Got EID {}'.format(eid))
+def estimate_subresource_size(tex : rd.TextureDescription, mip):
+    width = max(1, tex.width >> mip)
+    height = max(1, tex.height >> mip)
+    depth = max(1, tex.depth >> mip)
+    if tex.format.BlockFormat():
+        width = (width + 3) // 4
+        height = (height + 3) // 4
+    return width * height * depth * to_d3d12_pixel_size(tex.format)
+
+def parse_byte_size(text):
+    # Plain bytes, or with a K/M/G/T suffix (powers of 1024).
+    text = text.strip().upper().removesuffix('B').removesuffix('I')
+    scale = 1
+    for i, suffix in enumerate('KMGT'):
+        if text.endswith(suffix):
+            scale = 1024 ** (i + 1)
+            text = text[:-1]
+            break
+    return int(float(text) * scale)
+
+def format_byte_size(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            return f'{size} B' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+def default_cache_path(name):
+    cache_dir = os.environ.get('XDG_CACHE_HOME', '') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'rdoc-helper-utils', name)
+
+def env_flag(name, default = False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value not in ('', '0')
+
+class ExportOptions():
+    def __init__(self):
+        # Only dump mips and array slices referenced by a view.
+        # Unreferenced mips get a null data entry, unreferenced slices are left zero-filled.
+        self.referenced_subresources_only = env_flag('RDOC_EXPORT_REFERENCED_SUBRESOURCES')
+        # Content-addressed store shared between exports. Blobs are stored once by hash.
+        # A relative path is relative to the parent of the export directory, so sibling exports share it.
+        self.blob_store = os.environ.get('RDOC_EXPORT_BLOB_STORE', '')
+        # Compress blobs with 'zlib' or 'lzma'. Blobs which don't compress to at least the threshold ratio stay raw.
+        self.compression = os.environ.get('RDOC_EXPORT_COMPRESSION', '')
+        self.compression_threshold = float(os.environ.get('RDOC_EXPORT_COMPRESSION_THRESHOLD', '0.9'))
+        # Writes profile_trace.json (Chrome trace events) and profile_summary.txt next to capture.json.
+        self.profile = env_flag('RDOC_EXPORT_PROFILE')
+        # Analyze compute dispatches in the background while browsing, so exporting only has to do I/O.
+        self.speculative = env_flag('RDOC_EXPORT_SPECULATIVE', False)
+        # Only report what would be dumped, nothing is read back or written.
+        self.dry_run = env_flag('RDOC_EXPORT_DRY_RUN')
+        # Byte budget for all blobs of an export, 0 for no limit. Accepts K/M/G/T suffixes.
+        self.budget = parse_byte_size(os.environ.get('RDOC_EXPORT_BUDGET', '0'))
+        # What to do with blobs over budget: 'refuse' the export, 'truncate' the blob which crosses the limit
+        # and drop the rest, or 'zero' every blob which does not fit, leaving them zero-filled on replay.
+        self.budget_policy = os.environ.get('RDOC_EXPORT_BUDGET_POLICY', 'refuse')
+        # Buffers are read back and written in chunks of this size, which bounds peak memory use.
+        self.readback_chunk_size = max(4096, parse_byte_size(os.environ.get('RDOC_EXPORT_READBACK_CHUNK', '64M')))
+        # Pack all blobs into one capture.pack referenced by offset and size from capture.json.
+        self.archive = env_flag('RDOC_EXPORT_ARCHIVE')
+        # Write capture.json without indentation, streaming large arrays in batches.
+        self.compact_json = env_flag('RDOC_EXPORT_COMPACT_JSON')
+        # When exporting several dispatches, only dump blobs of resources written since an earlier dispatch dumped them.
+        self.incremental = env_flag('RDOC_EXPORT_INCREMENTAL')
+        # Shader dump trees searched for .dxil files missing from the output directory, separated by os.pathsep.
+        self.dxil_roots = [ root for root in os.environ.get('RDOC_EXPORT_DXIL_ROOTS', '').split(os.pathsep) if root ]
+        # Persistent filename index of the DXIL search roots.
+        self.dxil_index = os.environ.get('RDOC_EXPORT_DXIL_INDEX', '') or default_cache_path('dxil-index.json')
+        # Export plans are cached per capture and EID in this directory, least recently used ones are evicted
+        # once it grows past the size limit. Disabled when empty or with a size of 0.
+        self.plan_cache = os.environ.get('RDOC_EXPORT_PLAN_CACHE', '')
+        self.plan_cache_size = parse_byte_size(os.environ.get('RDOC_EXPORT_PLAN_CACHE_SIZE', '256M'))
+        # Fold descriptors of consecutive heap offsets with identical shape into runs in capture.json.
+        self.descriptor_runs = env_flag('RDOC_EXPORT_DESCRIPTOR_RUNS')
+
+    def plan_key(self):
+        # Options which affect the plan itself, a plan can only be reused if these match.
+        return (self.referenced_subresources_only, self.profile)
+
+    def output_key(self):
+        # Options which affect the files written for a plan, an earlier export can only be copied if these match.
+        return [ self.compression, self.compression_threshold, self.archive, self.budget, self.budget_policy,
+                 self.compact_json, self.descriptor_runs ]
+
+    def resolve_blob_store(self, dir_path):
+        if not self.blob_store:
+            return None
+        return os.path.join(os.path.dirname(os.path.abspath(dir_path)), self.blob_store)
+
+class ConstantBufferBlob():
+    __slots__ = ('name', 'path', 'resource', 'offset', 'size')
+
+    def __init__(self, name, resource, offset, size):
+        self.name = name
+        self.path = name + '.bin'
+        self.resource = resource
+        self.offset = offset
+        self.size = size
+
+class ExportPlan():
+    # Everything resolved for one dispatch. Dumping and capture.json emission only consume it.
+    __slots__ = ('eid', 'profiler', 'cache_key', 'dxil_name', 'root_signature_binary', 'dispatch_dimension',
+                 'buffers', 'textures', 'constant_buffers', 'texture_reads', 'texture_bytes',
+                 'srvs', 'uavs', 'cbvs', 'samplers', 'root_parameters')
+
+    def __init__(self, eid, profiler):
+        self.eid = eid
+        self.profiler = profiler
+        # Key of the plan in the plan cache, None if it's not cached.
+        self.cache_key = None
+        self.dxil_name = ''
+        self.root_signature_binary = b''
+        self.dispatch_dimension = (0, 0, 0)
+        # BufferState with named ranges, and TextureState with one path per mip.
+        self.buffers = []
+        self.textures = []
+        self.constant_buffers = []
+        # (resource, mip, slices, arraysize, path)
+        self.texture_reads = []
+        self.texture_bytes = 0
+        # Views and root parameters as they appear in capture.json.
+        self.srvs = []
+        self.uavs = []
+        self.cbvs = []
+        self.samplers = []
+        self.root_parameters = []
+
+    def estimated_bytes(self):
+        buffer_bytes = sum(r.end_offset - r.start_offset for buf in self.buffers for r in buf.ranges)
+        return buffer_bytes + sum(c.size for c in self.constant_buffers) + self.texture_bytes
+
+def persisted_resource_id(value):
+    # Placeholders for resources in pickled plans, PlanUnpickler resolves them against the capture.
+    raise pickle.UnpicklingError('Resources can only be resolved by PlanUnpickler')
+
+def persisted_texture(value):
+    raise pickle.UnpicklingError('Textures can only be resolved by PlanUnpickler')
+
+plan_pickle_reducers = {
+    rd.ResourceId : lambda obj : (persisted_resource_id, (int(obj),)),
+    rd.TextureDescription : lambda obj : (persisted_texture, (int(obj.resourceId),)),
+    ExportProfiler : lambda obj : (ExportProfiler, (obj.enabled,)),
+}
+
+plan_pickle_classes = { cls.__name__ : cls for cls in
+                        (ExportPlan, BufferState, BufferRange, TextureState, ConstantBufferBlob, ExportProfiler) }
+
+class PlanUnpickler(pickle.Unpickler):
+    def __init__(self, f, cache : CaptureCache):
+        super().__init__(f)
+        self.cache = cache
+
+    def find_class(self, module, name):
+        # The cache directory can be shared, only ever construct plan classes.
+        if module == __name__ and name == 'persisted_resource_id':
+            return self.resolve_resource_id
+        elif module == __name__ and name == 'persisted_texture':
+            return self.resolve_texture
+        elif module == __name__ and name in plan_pickle_classes:
+            return plan_pickle_classes[name]
+        raise pickle.UnpicklingError(f'{module}.{name} is not part of an export plan')
+
+    def resolve_resource_id(self, value):
+        resource = self.cache.get_resource_id(value)
+        if resource is None:
+            raise pickle.UnpicklingError(f'Resource {value} is not in the capture')
+        return resource
+
+    def resolve_texture(self, value):
+        tex = self.cache.get_texture(self.resolve_resource_id(value))
+        if tex is None:
+            raise pickle.UnpicklingError(f'Resource {value} is not a texture')
+        return tex
+
+@functools.lru_cache(maxsize = 1)
+def script_digest():
+    # Any change to the exporter invalidates cached plans.
+    return hash_file(os.path.abspath(__file__))
+
+def plan_cache_key(capture_path, eid, options : ExportOptions):
+    # Hashing a capture of several GiB takes too long to do while browsing, identify it by path, size and mtime.
+    st = os.stat(capture_path)
+    key = f'{os.path.abspath(capture_path)}:{st.st_size}:{st.st_mtime_ns}:{eid}:{script_digest()}:{options.plan_key()}'
+    return hashlib.sha256(key.encode()).hexdigest()
+
+class PlanCache():
+    # <key>.plan holds the pickled plan, <key>.exports.json the directories it was last exported to.
+    # Loading an entry counts as a use, the least recently used entries are evicted first.
+    max_exports = 4
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def plan_path(self, key):
+        return os.path.join(self.cache_dir, key + '.plan')
+
+    def exports_path(self, key):
+        return os.path.join(self.cache_dir, key + '.exports.json')
+
+    def load(self, key, cache : CaptureCache) -> Optional[ExportPlan]:
+        path = self.plan_path(key)
+        try:
+            with open(path, 'rb') as f:
+                plan = PlanUnpickler(f, cache).load()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f'Ignoring cached export plan {path}: {e}')
+            return None
+        plan.cache_key = key
+        return plan
+
+    def store(self, key, plan : ExportPlan):
+        os.makedirs(self.cache_dir, exist_ok = True)
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+                pickler.dispatch_table = plan_pickle_reducers
+                pickler.dump(plan)
+        atomic_write(self.plan_path(key), write)
+        plan.cache_key = key
+        self.evict()
+
+    def evict(self):
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.plan'):
+                    key = entry.name[:-len('.plan')]
+                    st = entry.stat()
+                    size = st.st_size
+                    try:
+                        size += os.stat(self.exports_path(key)).st_size
+                    except OSError:
+                        pass
+                    entries.append((st.st_mtime_ns, size, key))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_size:
+                break
+            for path in (self.plan_path(key), self.exports_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    def exports(self, key):
+        try:
+            with open(self.exports_path(key), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def record_export(self, key, dir_path, output_key, files):
+        dir_path = os.path.abspath(dir_path)
+        exports = [ export for export in self.exports(key) if export['Directory'] != dir_path ]
+        exports.insert(0, { 'Directory' : dir_path, 'Options' : output_key, 'Files' : files })
+        def write(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump(exports[:PlanCache.max_exports], f)
+        atomic_write(self.exports_path(key), write)
+
+def open_plan_cache(source, eid, options : ExportOptions):
+    # Returns the plan cache and the key of this dispatch, or (None, None) if plans can't be cached.
+    capture_path = source.capture_path()
+    if not options.plan_cache or options.plan_cache_size <= 0 or not capture_path:
+        return None, None
+    try:
+        return PlanCache(options.plan_cache, options.plan_cache_size), plan_cache_key(capture_path, eid, options)
+    except OSError as e:
+        print(f'Not caching export plan, could not stat {capture_path}: {e}')
+        return None, None
+
+def cache_plan(source, plan : ExportPlan, options : ExportOptions):
+    plan_cache, key = open_plan_cache(source, plan.eid, options)
+    if plan_cache is None:
+        return
+    try:
+        plan_cache.store(key, plan)
+    except (OSError, pickle.PicklingError) as e:
+        print(f'Failed to cache export plan for EID {plan.eid}: {e}')
+
+def plan_dispatch(source, eid, options : ExportOptions, store = True):
+    # Same as analyze_dispatch, but goes through the plan cache when the capture file is known.
+    # Plans are only stored when asked to, browsing alone shouldn't fill the cache.
+    plan_cache, key = open_plan_cache(source, eid, options)
+    if plan_cache is None:
+        return analyze_dispatch(source, eid, options)
+
+    plan = plan_cache.load(key, source.get_cache())
+    if plan is not None:
+        log(f'Using cached export plan for EID {eid}')
+        return plan
+
+    plan = analyze_dispatch(source, eid, options)
+    if store:
+        cache_plan(source, plan, options)
+    return plan
+
+def can_reuse_export(plan : ExportPlan, options : ExportOptions):
+    # Blob store references are relative to the export directory and profiles are per export.
+    return plan.cache_key is not None and options.plan_cache_size > 0 and not options.blob_store and not options.profile
+
+def file_unchanged(path, size, mtime):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_size == size and st.st_mtime_ns == mtime
+
+def reuse_previous_export(plan : ExportPlan, dir_path, options : ExportOptions, progress : ExportProgress):
+    # Same capture, same plan and same output options, so an intact earlier export has exactly the files we'd write.
+    if not can_reuse_export(plan, options):
+        return False
+
+    plan_cache = PlanCache(options.plan_cache, options.plan_cache_size)
+    for export in plan_cache.exports(plan.cache_key):
+        src_path = export['Directory']
+        files = export['Files']
+        if export['Options'] != options.output_key():
+            continue
+        if not all(file_unchanged(os.path.join(src_path, name), size, mtime) for name, (size, mtime) in files.items()):
+            continue
 
-    if eid == 0:
-        ctx.Extensions().ErrorDialog('Cannot capture EID 0', 'Export Error')
+        if src_path == os.path.abspath(dir_path):
+            print(f'{dir_path} already holds this export')
+            return True
+
+        progress.set_phase(f'Copying previous export from {src_path}')
+        progress.add_total(sum(size for size, _ in files.values()))
+        for name, (size, _) in files.items():
+            progress.check_cancelled()
+            dst_path = os.path.join(dir_path, name)
+            unlink_existing(dst_path)
+            shutil.copyfile(os.path.join(src_path, name), dst_path)
+            progress.advance(size)
+        record_export(plan, dir_path, options, list(files))
+        return True
+    return False
+
+def record_export(plan : ExportPlan, dir_path, options : ExportOptions, file_names):
+    if not can_reuse_export(plan, options):
         return
+    try:
+        files = {}
+        for name in file_names:
+            st = os.stat(os.path.join(dir_path, name))
+            files[name] = [ st.st_size, st.st_mtime_ns ]
+        PlanCache(options.plan_cache, options.plan_cache_size).record_export(plan.cache_key, dir_path, options.output_key(), files)
+    except OSError as e:
+        print(f'Failed to record export of EID {plan.eid}: {e}')
+
+# Per thread, speculative analysis on the replay thread runs quietly while an export can log on another.
+analysis_log = threading.local()
+
+def log(*args):
+    # Progress output of the analysis, warnings are always printed.
+    if not getattr(analysis_log, 'quiet', False):
+        print(*args)
+
+def dispatch_dxil_name(source):
+    # Cheap enough to filter dispatches by before analyzing them, the analysis reuses the parsed SPIR-V.
+    reflection : rd.ShaderReflection = source.pipeline_state().GetShaderReflection(rd.ShaderStage.Compute)
+    if reflection is None:
+        return None
+    return parse_spirv_resources(reflection.rawBytes)[1]
+
+def analyze_dispatch(source, eid, options : ExportOptions):
+    if eid == 0:
+        raise ExportError('Cannot capture EID 0')
 
-    pso : renderdoc.VKState = ctx.CurVulkanPipelineState()
+    profiler = ExportProfiler(options.profile)
+    profiler.begin_phase('Pipeline state')
+    pso : rd.VKState = source.vulkan_pipeline_state()
     if pso is None:
-        ctx.Extensions().ErrorDialog('Could not find Vulkan PSO state', 'Export Error')
-        return
+        raise ExportError('Could not find Vulkan PSO state')
 
     if not pso.compute:
-        ctx.Extensions().ErrorDialog('Could not find Vulkan compute state', 'Export Error')
-        return
+        raise ExportError('Could not find Vulkan compute state')
 
-    generic_pso : renderdoc.PipeState = ctx.CurPipelineState()
+    generic_pso : rd.PipeState = source.pipeline_state()
     reflection : rd.ShaderReflection = generic_pso.GetShaderReflection(rd.ShaderStage.Compute)
+    if reflection is None:
+        raise ExportError('There is no compute shader bound')
+    profiler.begin_phase('Parse SPIR-V')
     spirv_resources, dxil_name, root_signature_binary = parse_spirv_resources(reflection.rawBytes)
+    profiler.begin_phase('Pipeline state')
     push = [x for x in array.array('I', pso.pushconsts)]
 
     if len(spirv_resources) == 0:
-        ctx.Extensions().ErrorDialog('Could not find NonSemantic info for dxil-spirv in .spv. Outdated vkd3d-proton?', 'Export Error')
-        return
+        raise ExportError('Could not find NonSemantic info for dxil-spirv in .spv. Outdated vkd3d-proton?')
 
     ro : List[rd.UsedDescriptor] = generic_pso.GetReadOnlyResources(rd.ShaderStage.Compute)
     rw : List[rd.UsedDescriptor] = generic_pso.GetReadWriteResources(rd.ShaderStage.Compute)
     cbv : List[rd.UsedDescriptor] = generic_pso.GetConstantBlocks(rd.ShaderStage.Compute)
     samplers : List[rd.UsedDescriptor] = generic_pso.GetSamplers(rd.ShaderStage.Compute)
 
-    action_description : rd.ActionDescription = ctx.GetAction(eid)
+    action_description : rd.ActionDescription = source.get_action(eid)
 
     if not action_description:
-        ctx.Extensions().ErrorDialog('There is no action description', 'Export Error')
-        return
+        raise ExportError('There is no action description')
 
     if (not action_description.dispatchDimension) or len(action_description.dispatchDimension) != 3:
-        ctx.Extensions().ErrorDialog('Dispatch dimension is not valid', 'Export Error')
-        return
+        raise ExportError('Dispatch dimension is not valid')
+
+    cache = source.get_cache()
 
     unique_texture_resources = {}
     unique_buffer_resources = {}
@@ -416,65 +1972,66 @@ def export_callback(ctx : qrd.CaptureContext, data):
     # Very ugly special case for offset buffers. We'll have to rewrite texel buffer ranges as needed.
     # Goes away with descriptor buffer of course.
     # The offset buffer is always set 1, binding 1 under normal execution.
+    profiler.begin_phase('Offset buffer')
     offset_buffer = None
     for r in rw:
         res = reflection.readWriteResources[r.access.index]
         if res.bindArraySize == 1:
             if r.descriptor.type == rd.DescriptorType.ReadWriteBuffer and res.fixedBindNumber == 1 and res.fixedBindSetOrSpace == 1:
-                print('Found legacy offset buffer, dumping ...')
-                ctx.Replay().BlockInvoke(lambda replayer :
-                    write_output_u32(offset_buffer, replayer.GetBufferData(
-                        r.descriptor.resource, r.descriptor.byteOffset, r.descriptor.byteSize)))
+                log('Found legacy offset buffer, dumping ...')
+                # Fetched once, both range accumulation and view emission index straight into it.
+                desc = r.descriptor
+                offset_buffer = source.invoke(lambda replayer :
+                    read_buffer_u32(replayer, desc.resource, desc.byteOffset, desc.byteSize))
                 break
 
-    for kind in [ro, rw]:
-        for r in kind:
-            if r.descriptor.resource == 0:
-                continue
-
-            if is_uav(r.descriptor.type):
-                res = reflection.readWriteResources[r.access.index]
-            else:
-                res = reflection.readOnlyResources[r.access.index]
-
-            name = res.name
-
-            if res.bindArraySize == 1:
-                continue
-
-            if is_buffer(r.descriptor.type):
-                if r.descriptor.resource not in unique_buffer_resources:
-                    unique_buffer_resources[r.descriptor.resource] = BufferState(r.descriptor.resource)
-
-                # Turbo-hacky handshake with vkd3d-proton
-                force_srv = 'SRV' in name
-                uav = is_uav(r.descriptor.type) and (not force_srv)
-                buf = unique_buffer_resources[r.descriptor.resource]
-
-                if is_typed(r.descriptor.type) and offset_buffer:
-                    # Rewrite the offset / size to match the offset buffer values.
-                    # Ignore offset buffer for SSBO since no driver should hit that path anymore.
-                    offset = r.descriptor.byteOffset + r.descriptor.format.ElementSize() * offset_buffer[4 * r.access.arrayElement + 2]
-                    size = r.descriptor.format.ElementSize() * offset_buffer[4 * r.access.arrayElement + 3]
-                else:
-                    offset = r.descriptor.byteOffset
-                    size = r.descriptor.byteSize
-
-                buf.add_accessed_range(offset, offset + size, uav)
+    profiler.begin_phase('Descriptor classification')
+    descriptors = DescriptorTable().build(reflection, ro, rw)
+    flags = descriptors.flags
+    heap_offsets = descriptors.heap_offsets
+    offsets = descriptors.offsets
+    sizes = descriptors.sizes
+    view_resources = descriptors.resources
+    formats = descriptors.formats
+    for i in range(len(descriptors)):
+        f = flags[i]
+        if f & DESC_NULL:
+            continue
 
-            elif is_image(r.descriptor.type):
-                if r.descriptor.resource not in unique_texture_resources:
-                    unique_texture_resources[r.descriptor.resource] = TextureState(r.descriptor.resource)
+        resource = view_resources[i]
+        if f & DESC_BUFFER:
+            buf = unique_buffer_resources.get(resource)
+            if buf is None:
+                buf = unique_buffer_resources[resource] = BufferState(resource)
 
-                tex = unique_texture_resources[r.descriptor.resource]
-                tex.add_view_format(r.descriptor.format)
-                if is_uav(r.descriptor.type):
-                    tex.rw = True
-                else:
-                    tex.ro = True
+            if (f & DESC_TYPED) and offset_buffer is not None:
+                offset, size = rewrite_texel_buffer_range(offset_buffer, heap_offsets[i], offsets[i], sizes[i],
+                                                          formats[i].ElementSize())
+            else:
+                offset = offsets[i]
+                size = sizes[i]
+
+            # Turbo-hacky handshake with vkd3d-proton, UAV views are demoted to SRV by binding name.
+            buf.add_accessed_range(offset, offset + size, (f & DESC_UAV_VIEW) != 0)
+
+        elif f & DESC_IMAGE:
+            tex = unique_texture_resources.get(resource)
+            if tex is None:
+                tex = unique_texture_resources[resource] = TextureState(resource)
+
+            desc = descriptors.image_descriptors[i]
+            tex.add_view_format(formats[i])
+            tex.add_view_subresources(desc.firstMip, desc.numMips, desc.firstSlice, desc.numSlices)
+            if f & DESC_UAV:
+                tex.rw = True
+            else:
+                tex.ro = True
 
+    profiler.begin_phase('Root descriptors')
+    # Resolved once, (kind, index, resource, offset) for every root descriptor and Push CBV.
+    root_descriptors = []
     for res in spirv_resources:
-        print(res)
+        log(res)
         # Register root descriptors
         kind = res[0]
         index = res[1]
@@ -482,16 +2039,18 @@ def export_callback(ctx : qrd.CaptureContext, data):
         pushsize = res[3] // 4
         if kind == 'SRV' or kind == 'UAV' or kind == 'CBV':
             bda = push[pushoffset] | (push[pushoffset + 1] << 32)
-            resid, offset, size = lookup_bda(ctx, bda, 0x10000 if kind == 'CBV' else 0xffffffff)
-            print(f'Looking up BDA {hex(bda)} -> {resid}, offset {offset}, size {size}')
+            with profiler.scope('lookup_bda', 'analysis'):
+                resid, offset, size = lookup_bda(cache, bda, 0x10000 if kind == 'CBV' else 0xffffffff)
+            log(f'Looking up BDA {hex(bda)} -> {resid}, offset {offset}, size {size}')
             if resid != 0:
                 if resid not in unique_buffer_resources:
                     unique_buffer_resources[resid] = BufferState(resid)
                 buf = unique_buffer_resources[resid]
                 buf.add_accessed_range(offset, offset + size, kind == 'UAV')
-                print(f'Registering BDA access of type {kind}')
+                root_descriptors.append((kind, index, resid, offset))
+                log(f'Registering BDA access of type {kind}')
             else:
-                print(f'Failed to lookup BDA {hex(bda)}')
+                print(f'Failed to lookup BDA {hex(bda)}, cannot dump parameter {index}')
         elif kind == 'PushCBV':
             push_set = res[2]
             push_desc = res[3]
@@ -503,69 +2062,543 @@ def export_callback(ctx : qrd.CaptureContext, data):
                         unique_buffer_resources[resid] = BufferState(resid)
                     buf = unique_buffer_resources[resid]
                     buf.add_accessed_range(c.descriptor.byteOffset, c.descriptor.byteOffset + min(0x10000, c.descriptor.byteSize), False)
-                    print(f'Registering Push CBV access.')
+                    root_descriptors.append(('CBV', index, resid, c.descriptor.byteOffset))
+                    log(f'Registering Push CBV access.')
                     break
 
-    blob_index = 1
-    dir_path = ctx.Extensions().OpenDirectoryName('Export to directory')
+    plan = ExportPlan(eid, profiler)
+    plan.dxil_name = dxil_name
+    plan.root_signature_binary = root_signature_binary
+    plan.dispatch_dimension = tuple(action_description.dispatchDimension)
 
-    if len(dir_path) == 0:
-        ctx.Extensions().ErrorDialog('No directory selected, skipping export', 'Export Error')
-        return
+    profiler.begin_phase('Plan blobs')
+    blob_index = plan_blobs(plan, unique_buffer_resources, unique_texture_resources, cache, options)
 
-    # We need to dump resource state as it is observed *before* this EID.
-    ctx.SetEventID([], eid - 1, eid - 1)
+    # CBVs and SRV/UAVs share the resource heap, the first descriptor seen for a heap offset wins.
+    used_resource_heap_offsets = set()
+    profiler.begin_phase('Samplers and CBVs')
+    plan_samplers(plan, reflection, samplers)
+    plan_constant_buffers(plan, reflection, cbv, used_resource_heap_offsets, blob_index)
+
+    profiler.begin_phase('SRV and UAV descriptors')
+    plan_views(plan, descriptors, offset_buffer, unique_buffer_resources, unique_texture_resources, used_resource_heap_offsets)
+
+    profiler.begin_phase('Root parameters')
+    plan_root_parameters(plan, spirv_resources, push, root_descriptors, unique_buffer_resources)
+    profiler.end_phase()
+    return plan
+
+def plan_blobs(plan : ExportPlan, unique_buffer_resources, unique_texture_resources, cache : CaptureCache, options : ExportOptions):
+    blob_index = 1
 
-    # Dump accessed buffers to file
     for buf in unique_buffer_resources.values():
         buf.align()
         for buf_range in buf.ranges:
             # Dump every unique subrange
             buf_range.name = f'buffer{blob_index}'
-            path = buf_range.name + '.bin'
-            buf_range.path = path
+            buf_range.path = buf_range.name + '.bin'
             blob_index += 1
-            print(f'Dumping buffer to: {path}')
-            ctx.Replay().BlockInvoke(lambda replayer :
-                                    dump_binary_to_file(os.path.join(dir_path, path),
-                                                        replayer.GetBufferData(buf.resource, buf_range.start_offset, buf_range.end_offset - buf_range.start_offset)))
+            log(f'Dumping buffer to: {buf_range.path}')
+        plan.buffers.append(buf)
 
-    # Dump textures to file
-    textures : List[rd.TextureDescription] = ctx.GetTextures()
     for img in unique_texture_resources.values():
         img.name = f'texture{blob_index}'
         blob_index += 1
-        for tex in textures:
-            if tex.resourceId == img.resource:
-                img.base_format = tex.format
-                for mip in range(tex.mips):
-                    # Dump mips separately. Fuse all slices together.
-                    path = f'{img.name}_mip{mip}.bin'
-                    print(f'Dumping texture to: {path}')
-                    img.paths.append(path)
-                    img.desc = tex
-                    img.creationFlags = tex.creationFlags
-                    with open(os.path.join(dir_path, path), 'wb') as f:
-                        for layer in range(tex.arraysize):
-                            sub = rd.Subresource()
-                            sub.mip = mip
-                            sub.slice = layer
-                            sub.sample = 0
-                            ctx.Replay().BlockInvoke(
-                                    lambda replayer :
-                                    f.write(replayer.GetTextureData(img.resource, sub)))
+        tex = cache.get_texture(img.resource)
+        if tex is None:
+            print(f'Could not find texture description for {img.name}')
+            continue
+        img.desc = tex
+        # Only the names are needed from here on, which keeps the plan free of opaque format objects.
+        img.cast_formats = [ to_d3d12_format(x, False) for x in img.formats ]
+        img.formats = []
+        partial = options.referenced_subresources_only and len(img.subresources) != 0
+        for mip in range(tex.mips):
+            # Dump mips separately. Fuse all slices together.
+            slices = img.referenced_slices(mip) if partial else list(range(tex.arraysize))
+            if len(slices) == 0:
+                # Placeholder, the replayer still creates the full resource.
+                log(f'Skipping unreferenced mip {mip} of {img.name}')
+                img.paths.append(None)
+                continue
+            path = f'{img.name}_mip{mip}.bin'
+            log(f'Dumping texture to: {path}')
+            img.paths.append(path)
+            plan.texture_reads.append((img.resource, mip, slices, tex.arraysize, path))
+            plan.texture_bytes += len(slices) * estimate_subresource_size(tex, mip)
+        plan.textures.append(img)
 
-    capture = {}
+    return blob_index
 
-    dump_binary_to_file(os.path.join(dir_path, 'rootsig.rs'), root_signature_binary)
+def plan_samplers(plan : ExportPlan, reflection : rd.ShaderReflection, samplers):
+    used_sampler_heap_offsets = set()
+    for r in samplers:
+        block = reflection.samplers[r.access.index]
+        samp = r.sampler
+        # Skip immutable samplers
+        if block.bindArraySize == 1 or samp.creationTimeConstant:
+            continue
+        if r.access.arrayElement in used_sampler_heap_offsets:
+            continue
+        used_sampler_heap_offsets.add(r.access.arrayElement)
+        desc = {
+            'HeapOffset' : r.access.arrayElement,
+            'AddressU' : convert_address(samp.addressU),
+            'AddressV' : convert_address(samp.addressV),
+            'AddressW' : convert_address(samp.addressW),
+            'ComparisonFunc' : convert_comparison_func(samp.compareFunction),
+            'MaxAnisotropy' : int(samp.maxAnisotropy),
+            'MinLOD' : samp.minLOD,
+            'MaxLOD' : samp.maxLOD,
+            'MipLODBias' : samp.mipBias,
+            'Filter' : convert_filter(samp.filter)
+        }
 
-    capture['CS'] = dxil_name
-    capture['RootSignature'] = 'rootsig.rs'
+        if samp.UseBorder():
+            desc['BorderColor'] = [ x for x in samp.borderColorValue.float ]
+        plan.samplers.append(desc)
+
+def plan_constant_buffers(plan : ExportPlan, reflection : rd.ShaderReflection, cbv, used_resource_heap_offsets, blob_index):
+    # Standalone CBVs are always small, so ignore them w.r.t. subrange tracking.
+    for r in cbv:
+        block = reflection.constantBlocks[r.access.index]
+        if block.compileConstants or (not block.bufferBacked):
+            continue
+        if block.bindArraySize == 1:
+            # Handle push descriptors later
+            continue
+        if r.access.arrayElement in used_resource_heap_offsets:
+            continue
+        used_resource_heap_offsets.add(r.access.arrayElement)
+
+        name = f'cbv{blob_index}'
+        blob_index += 1
+
+        if r.descriptor.resource:
+            plan.constant_buffers.append(ConstantBufferBlob(name, r.descriptor.resource, r.descriptor.byteOffset, r.descriptor.byteSize))
+
+        cbv_desc = {
+            'HeapOffset' : r.access.arrayElement,
+            'Resource' : 'NULL' if r.descriptor.resource == 0 else name,
+            'BufferLocation' : 0,
+            'SizeInBytes' : r.descriptor.byteSize
+        }
+        plan.cbvs.append(cbv_desc)
+
+def plan_views(plan : ExportPlan, descriptors : DescriptorTable, offset_buffer, unique_buffer_resources, unique_texture_resources, used_resource_heap_offsets):
+    counter_candidates = descriptors.counter_candidates
+    raw_buffer_heap_offsets = descriptors.raw_buffer_heap_offsets
+    flags = descriptors.flags
+    heap_offsets = descriptors.heap_offsets
+    binding_indices = descriptors.binding_indices
+    offsets = descriptors.offsets
+    sizes = descriptors.sizes
+    view_resources = descriptors.resources
+    formats = descriptors.formats
+    decoded_names = [ name.split('_') for name in descriptors.bindings ]
+
+    for i in range(len(descriptors)):
+        f = flags[i]
+        heap_offset = heap_offsets[i]
+
+        # Do not directly emit UAV counters.
+        is_counter_candidate = heap_offset in counter_candidates
+        if (f & DESC_BUFFER) and (f & DESC_TYPED) and is_counter_candidate and heap_offset in raw_buffer_heap_offsets:
+            continue
+
+        desc = { 'HeapOffset' : heap_offset }
+        # Can happen for aliased resources for vectorization purposes, just ignore
+        if heap_offset in used_resource_heap_offsets:
+            continue
+        used_resource_heap_offsets.add(heap_offset)
+
+        uav = (f & DESC_UAV_VIEW) != 0
+
+        if f & DESC_BUFFER:
+            buf = None if f & DESC_NULL else unique_buffer_resources[view_resources[i]]
+            if buf:
+                # Typed views were accumulated with the range from the offset buffer, so look that one up.
+                offset = offsets[i]
+                size = sizes[i]
+                if f & DESC_TYPED:
+                    element_size = formats[i].ElementSize()
+                    offset, size = rewrite_texel_buffer_range(offset_buffer, heap_offset, offset, size, element_size)
+
+                buf_range : BufferRange = buf.find_matching_range(offset, uav)
+                if buf_range:
+                    desc['Resource'] = buf_range.name + ('.rw' if uav else '.ro')
+                    desc['ViewDimension'] = 'BUFFER'
+
+                    if f & DESC_TYPED:
+                        desc['Format'] = to_d3d12_format(formats[i], False)
+                        if (offset - buf_range.start_offset) % element_size != 0:
+                            print('TexelBuffer does not align properly to buffer start. Is game using non 64 KiB alignment?')
+                        desc['FirstElement'] = (offset - buf_range.start_offset) // element_size
+                        desc['NumElements'] = size // element_size
+                    else:
+                        decoded_name = decoded_names[binding_indices[i]]
+                        if len(decoded_name) >= 3:
+                            element_size = 0
+
+                            if decoded_name[1] == 'StructuredBuffer':
+                                element_size = int(decoded_name[2])
+                                desc['StructureByteStride'] = element_size
+
+                                if is_counter_candidate:
+                                    counter = counter_candidates[heap_offset]
+                                    counter_buf = unique_buffer_resources[counter[0]]
+                                    counter_buf_range : BufferRange = counter_buf.find_matching_range(counter[1], True)
+                                    desc['CounterResource'] = counter_buf_range.name + '.rw'
+                                    desc['CounterOffsetInBytes'] = counter[1] - counter_buf_range.start_offset
+                            elif decoded_name[1] == 'ByteAddressBuffer':
+                                desc['Format'] = 'R32_TYPELESS'
+                                desc['Flags'] = 'RAW'
+                                element_size = 4
+                            else:
+                                print(f'Unrecognized resource type {decoded_name[1]}')
+
+                            if (offsets[i] - buf_range.start_offset) % element_size != 0:
+                                print('Raw buffer does not align properly to buffer start. Is game using non 64 KiB alignment?')
+                            desc['FirstElement'] = (offsets[i] - buf_range.start_offset) // element_size
+                            desc['NumElements'] = sizes[i] // element_size
+                else:
+                    print('Could not find matching range?')
+            else:
+                desc['Resource'] = 'NULL'
+                desc['ViewDimension'] = 'BUFFER'
+                desc['Format'] = 'R32_UINT'
+                if not (f & DESC_TYPED):
+                    desc['Flags'] = 'RAW'
+                    desc['Format'] = 'R32_TYPELESS'
+
+        elif f & DESC_IMAGE:
+            view = descriptors.image_descriptors[i]
+            img = None if f & DESC_NULL else unique_texture_resources[view_resources[i]]
+            desc['Resource'] = (img.name + ('.rw' if uav else '.ro')) if img else 'NULL'
+            desc['ViewDimension'] = to_view_type(view.textureType)
+            desc['Format'] = to_d3d12_format(formats[i], False)
+            if img:
+                if view_type_has_mip_range(view.textureType, uav):
+                    desc['MostDetailedMip'] = view.firstMip
+                    desc['MipLevels'] = view.numMips
+                    desc['ResourceMinLODClamp'] = view.minLODClamp
+
+                if view_type_has_mip_slice(view.textureType, uav):
+                    desc['MipSlice'] = view.firstMip
+
+                if view_type_has_array_range(view.textureType, uav):
+                    desc['FirstArraySlice'] = view.firstSlice
+                    desc['ArraySize'] = view.numSlices
+
+                if view_type_has_cube_range(view.textureType, uav):
+                    desc['First2DArrayFace'] = view.firstSlice
+                    desc['NumCubes'] = view.numSlices
+
+                #if view_type_has_wsize(view.textureType, uav):
+                #    desc['FirstWSlice'] = view.firstSlice
+                #    desc['WSize'] = view.numSlices
+        else:
+            print(f'Skipping unknown resource.')
+            continue
+
+        if uav:
+            plan.uavs.append(desc)
+        else:
+            plan.srvs.append(desc)
+
+def plan_root_parameters(plan : ExportPlan, spirv_resources, push, root_descriptors, unique_buffer_resources):
+    resolved = { index : (kind, resid, offset) for kind, index, resid, offset in root_descriptors }
+
+    for res in spirv_resources:
+        kind = res[0]
+        index = res[1]
+        pushoffset = res[2] // 4
+        pushsize = res[3] // 4
+        if kind == 'SRV' or kind == 'UAV' or kind == 'CBV' or kind == 'PushCBV':
+            if index not in resolved:
+                continue
+            view_kind, resid, offset = resolved[index]
+            uav = view_kind == 'UAV'
+            buf_range = unique_buffer_resources[resid].find_matching_range(offset, uav)
+            if buf_range:
+                plan.root_parameters.append({ 'index' : index, 'type' : view_kind, 'Resource' : buf_range.name + ('.rw' if uav else '.ro'), 'offset' : offset - buf_range.start_offset })
+            else:
+                raise ExportError('Could not find buffer range for resource. Probably a bug in the script.')
+        elif kind == 'ResourceTable' or kind == 'SamplerTable':
+            plan.root_parameters.append({ 'index' : index, 'type' : kind, 'offset' : push[pushoffset] })
+        elif kind == 'Constant':
+            plan.root_parameters.append({ 'index' : index, 'type' : kind, 'data' : push[pushoffset : pushoffset + pushsize] })
+
+def plan_blob_sizes(plan : ExportPlan):
+    # (path, bytes, granularity) of every blob in the order they are dumped. Textures are cut at slice granularity.
+    sizes = []
+    for buf in plan.buffers:
+        for buf_range in buf.ranges:
+            sizes.append((buf_range.path, buf_range.end_offset - buf_range.start_offset, 1))
+    for c in plan.constant_buffers:
+        sizes.append((c.path, c.size, 1))
+    descs = { img.resource : img.desc for img in plan.textures }
+    for resource, mip, slices, arraysize, path in plan.texture_reads:
+        slice_size = estimate_subresource_size(descs[resource], mip)
+        sizes.append((path, len(slices) * slice_size, slice_size))
+    return sizes
+
+def plan_budget(plan : ExportPlan, options : ExportOptions):
+    # Returns path -> bytes to keep for blobs over budget, and their capture.json records.
+    limits = {}
+    skipped = []
+    if options.budget <= 0:
+        return limits, skipped
+
+    sizes = plan_blob_sizes(plan)
+    total = sum(size for _, size, _ in sizes)
+    if total <= options.budget:
+        return limits, skipped
+
+    match options.budget_policy:
+        case 'refuse':
+            raise ExportError(f'Export needs {format_byte_size(total)}, which is over the budget of {format_byte_size(options.budget)}')
+        case 'truncate' | 'zero':
+            pass
+        case _:
+            raise ExportError(f'Unknown budget policy {options.budget_policy}')
+
+    remaining = options.budget
+    for path, size, granularity in sizes:
+        if size <= remaining:
+            remaining -= size
+            continue
+        kept = remaining - remaining % granularity if options.budget_policy == 'truncate' else 0
+        remaining -= kept
+        limits[path] = kept
+        skipped.append({ 'name' : path, 'Size' : size, 'Written' : kept })
+    return limits, skipped
+
+def describe_plan(plan : ExportPlan, options : ExportOptions):
+    lines = [ f'EID {plan.eid}, {plan.dxil_name}' ]
+    for buf in plan.buffers:
+        for buf_range in buf.ranges:
+            lines.append(f'  {buf_range.path:<32} {format_byte_size(buf_range.end_offset - buf_range.start_offset):>12}  '
+                         f'buffer [{buf_range.start_offset:#x}, {buf_range.end_offset:#x})')
+    for c in plan.constant_buffers:
+        lines.append(f'  {c.path:<32} {format_byte_size(c.size):>12}  CBV')
+    descs = { img.resource : img.desc for img in plan.textures }
+    for resource, mip, slices, arraysize, path in plan.texture_reads:
+        size = estimate_subresource_size(descs[resource], mip)
+        lines.append(f'  {path:<32} {format_byte_size(len(slices) * size):>12}  mip {mip}, {len(slices)} / {arraysize} slices of {format_byte_size(size)}')
+
+    lines.append(f'Total {format_byte_size(plan.estimated_bytes())}')
+    if options.budget > 0:
+        try:
+            _, skipped = plan_budget(plan, options)
+            for record in skipped:
+                lines.append(f'Over budget: {record["name"]}, {format_byte_size(record["Written"])} of {format_byte_size(record["Size"])} kept')
+        except ExportError as e:
+            lines.append(str(e))
+    return lines
+
+# Usages which can change the contents of a resource. Not every RenderDoc version has every stage.
+write_usages = frozenset(getattr(rd.ResourceUsage, name) for name in (
+    'StreamOut', 'VS_RWResource', 'HS_RWResource', 'DS_RWResource', 'GS_RWResource', 'PS_RWResource',
+    'TS_RWResource', 'MS_RWResource', 'CS_RWResource', 'All_RWResource', 'ColorTarget', 'DepthStencilTarget',
+    'Clear', 'Discard', 'GenMips', 'Resolve', 'ResolveDst', 'Copy', 'CopyDst', 'CPUWrite')
+    if hasattr(rd.ResourceUsage, name))
+
+def plan_blob_keys(plan : ExportPlan):
+    # (path, resource, key), blobs with the same key hold the same bytes of the same resource.
+    for buf in plan.buffers:
+        for buf_range in buf.ranges:
+            yield buf_range.path, buf.resource, ('buffer', buf.resource, buf_range.start_offset, buf_range.end_offset)
+    for c in plan.constant_buffers:
+        yield c.path, c.resource, ('buffer', c.resource, c.offset, c.offset + c.size)
+    for resource, mip, slices, arraysize, path in plan.texture_reads:
+        yield path, resource, ('texture', resource, mip, tuple(slices), arraysize)
+
+class IncrementalBlob():
+    __slots__ = ('eid', 'path', 'compression', 'digest')
+
+    def __init__(self, eid, path, compression, digest = None):
+        self.eid = eid
+        self.path = path
+        self.compression = compression
+        self.digest = digest
+
+    def get_digest(self):
+        if self.digest is None:
+            self.digest = hash_file(self.path)
+        return self.digest
+
+class IncrementalExport():
+    # Exports a sequence of dispatches, ascending by EID, into sibling directories.
+    # A blob is only dumped again if its resource was written since the dispatch which dumped it,
+    # otherwise capture.json references the earlier file.
+    # Writes through buffer device addresses, e.g. root UAVs, don't show up as usage. Buffers without
+    # recorded writes are still dumped, and only replaced by a reference if the contents are identical.
+    def __init__(self, source):
+        self.source = source
+        # resource -> sorted EIDs which write it
+        self.write_events = {}
+        # key -> IncrementalBlob
+        self.blobs = {}
+        # path -> IncrementalBlob to compare against, for the buffer blobs of the dispatch being written
+        self.unverified = {}
+
+    def fetch_write_events(self, resources):
+        missing = [ resource for resource in resources if resource not in self.write_events ]
+        if not missing:
+            return
+        def fetch(replayer : rd.ReplayController):
+            for resource in missing:
+                self.write_events[resource] = sorted(set(
+                    usage.eventId for usage in replayer.GetUsage(resource) if usage.usage in write_usages))
+        self.source.invoke(fetch)
+
+    def written_between(self, resource, first_eid, end_eid):
+        events = self.write_events[resource]
+        i = bisect.bisect_left(events, first_eid)
+        return i < len(events) and events[i] < end_eid
+
+    def plan_reuse(self, plan : ExportPlan, dir_path, limits):
+        # Returns path -> (path relative to dir_path, compression) of blobs which don't need to be dumped.
+        keys = list(plan_blob_keys(plan))
+        self.fetch_write_events(set(resource for _, resource, _ in keys))
+        reused = {}
+        self.unverified = {}
+        for path, resource, key in keys:
+            earlier = self.blobs.get(key)
+            # Blobs over budget were cut short, dump those in full if possible.
+            if earlier is None or path in limits:
+                continue
+            # The dump of an EID is the state before it, so a write by that dispatch itself counts as well.
+            if earlier.eid > plan.eid or self.written_between(resource, earlier.eid, plan.eid):
+                continue
+            if key[0] == 'buffer':
+                self.unverified[path] = earlier
+            else:
+                reused[path] = (os.path.relpath(earlier.path, dir_path), earlier.compression)
+        print(f'Reusing {len(reused)} of {len(keys)} blobs from earlier dispatches, comparing {len(self.unverified)} buffers')
+        return reused
+
+    def record(self, plan : ExportPlan, dir_path, blob_output : BlobOutput, limits, reused):
+        # Reused blobs keep pointing at the dispatch which dumped them.
+        # Buffers which turn out to be unchanged are added to reused.
+        verified = 0
+        for path, resource, key in plan_blob_keys(plan):
+            if path in limits or path in reused:
+                continue
+            name, compression = blob_output.resolve(path)
+            blob = IncrementalBlob(plan.eid, os.path.join(dir_path, name), compression)
+            earlier = self.unverified.get(path)
+            if (earlier is not None and earlier.compression == compression and
+                    os.path.getsize(earlier.path) == os.path.getsize(blob.path) and earlier.get_digest() == blob.get_digest()):
+                os.remove(blob.path)
+                reused[path] = (os.path.relpath(earlier.path, dir_path), compression)
+                verified += 1
+                continue
+            self.blobs[key] = blob
+        self.unverified = {}
+        if verified:
+            print(f'Reusing {verified} unchanged buffers from earlier dispatches')
+
+def dump_dispatch(source, plan : ExportPlan, dir_path, options : ExportOptions, progress : Optional[ExportProgress] = None,
+                  incremental : Optional[IncrementalExport] = None):
+    # We need to dump resource state as it is observed *before* this EID.
+    source.set_event(plan.eid - 1)
+    try:
+        write_dispatch(source, plan, dir_path, options, progress if progress else ExportProgress(), incremental)
+    finally:
+        source.set_event(plan.eid)
+
+def write_dispatch(source, plan : ExportPlan, dir_path, options : ExportOptions, progress : ExportProgress,
+                   incremental : Optional[IncrementalExport] = None):
+    try:
+        # Incremental exports reference blobs of their neighbours, so they are not self-contained enough to copy.
+        if incremental:
+            write_dispatch_data(source, plan, dir_path, options, progress, incremental)
+        elif not reuse_previous_export(plan, dir_path, options, progress):
+            files = write_dispatch_data(source, plan, dir_path, options, progress)
+            record_export(plan, dir_path, options, files)
+    finally:
+        plan.profiler.write(dir_path)
+
+def write_dispatch_data(source, plan : ExportPlan, dir_path, options : ExportOptions, progress : ExportProgress,
+                        incremental : Optional[IncrementalExport] = None):
+    profiler = plan.profiler
+    limits, skipped = plan_budget(plan, options)
+    reused = incremental.plan_reuse(plan, dir_path, limits) if incremental else {}
+    if options.archive:
+        if options.compression:
+            print('Blobs are not compressed when writing an archive.')
+        blob_output = ArchiveOutput(dir_path, profiler)
+    else:
+        blob_output = BlobOutput(dir_path, options, profiler)
+    try:
+        write_blobs(source, plan, dir_path, options, progress, blob_output, limits, reused)
+        blob_output.finish()
+    finally:
+        blob_output.close()
+
+    if incremental:
+        incremental.record(plan, dir_path, blob_output, limits, reused)
+
+    # Blobs which were not written at all are zero-filled by the replayer, same as unreferenced mips.
+    dropped = set(path for path, size in limits.items() if size == 0)
+    return write_capture_json(plan, dir_path, options, blob_output, progress, dropped, skipped, reused)
+
+def write_blobs(source, plan : ExportPlan, dir_path, options : ExportOptions, progress : ExportProgress, blob_output, limits, reused):
+    profiler = plan.profiler
+
+    # Reads are batched so adjacent ranges of the same buffer are fetched together.
+    buffer_reads = BufferReadBatch()
+    for buf in plan.buffers:
+        for buf_range in buf.ranges:
+            size = limits.get(buf_range.path, buf_range.end_offset - buf_range.start_offset)
+            if size and buf_range.path not in reused:
+                buffer_reads.add(buf.resource, buf_range.start_offset, size, buf_range.path)
+    for c in plan.constant_buffers:
+        size = limits.get(c.path, c.size)
+        if size and c.path not in reused:
+            buffer_reads.add(c.resource, c.offset, size, c.path)
+
+    # Over budget textures keep as many leading slices as fit.
+    texture_reads = []
+    texture_bytes = 0
+    descs = { img.resource : img.desc for img in plan.textures }
+    for resource, mip, slices, arraysize, path in plan.texture_reads:
+        if path in reused:
+            continue
+        slice_size = estimate_subresource_size(descs[resource], mip)
+        if path in limits:
+            slices = slices[:limits[path] // slice_size]
+            if len(slices) == 0:
+                continue
+        texture_reads.append((resource, mip, slices, arraysize, path))
+        texture_bytes += len(slices) * slice_size
+
+    dump_binary_to_file(os.path.join(dir_path, 'rootsig.rs'), plan.root_signature_binary)
+
+    progress.add_total(buffer_reads.total_bytes() + texture_bytes)
+    progress.check_cancelled()
+
+    progress.set_phase('Dumping buffers')
+    profiler.begin_phase('Buffer readback')
+    source.invoke(lambda replayer : buffer_reads.execute(replayer, blob_output, progress, options.readback_chunk_size))
+    progress.check_cancelled()
+
+    progress.set_phase('Dumping textures')
+    profiler.begin_phase('Texture readback')
+    # The replay thread only fetches subresources, writing happens in the background.
+    subresource_writer = SubresourceWriter(blob_output)
+    try:
+        source.invoke(lambda replayer : fetch_texture_data(replayer, texture_reads, subresource_writer, progress, profiler))
+    finally:
+        subresource_writer.finish()
+    progress.check_cancelled()
+
+def plan_resources(plan : ExportPlan):
     resources = []
-    dispatch_dim = action_description.dispatchDimension
-    capture['Dispatch'] = [dispatch_dim[0], dispatch_dim[1], dispatch_dim[2]]
 
-    for buf in unique_buffer_resources.values():
+    for buf in plan.buffers:
         for buf_range in buf.ranges:
             for uav in range(2):
                 if uav == 0 and (not buf_range.ro):
@@ -581,36 +2614,37 @@ def export_callback(ctx : qrd.CaptureContext, data):
                 }
                 resources.append(res)
 
-    for img in unique_texture_resources.values():
+    for img in plan.textures:
         for uav in range(2):
             if uav == 0 and (not img.ro):
                 continue
             if uav == 1 and (not img.rw):
                 continue
 
-            flags = img.creationFlags
-            cast_formats = [ to_d3d12_format(x, False) for x in img.formats ]
+            flags = img.desc.creationFlags
+            base_format = img.desc.format
+            cast_formats = list(img.cast_formats)
 
             # Ensure that if we have a UAV + BC texture, we must add at least one format to the cast list which is UAV compatible.
             if (flags & rd.TextureCategory.ShaderReadWrite):
-                if img.base_format.BlockFormat():
-                    if img.base_format.ElementSize() == 16:
+                if base_format.BlockFormat():
+                    if base_format.ElementSize() == 16:
                         cast_formats.append('R32G32B32A32_UINT')
-                    elif img.base_format.ElementSize() == 8:
+                    elif base_format.ElementSize() == 8:
                         cast_formats.append('R32G32_UINT')
-                elif img.base_format.Name().endswith('_SRGB'):
+                elif base_format.Name().endswith('_SRGB'):
                     # If the base format is SRGB we need the UNORM variant in the cast list.
-                    cast_formats.append(img.base_format.Name()[:-5])
+                    cast_formats.append(base_format.Name()[:-5])
 
             res = {
                 'name' : img.name + ('.ro' if uav == 0 else '.rw'),
                 'Dimension' : f'TEXTURE{img.desc.dimension}D',
                 'Width' : img.desc.width,
                 'Height' : img.desc.height,
-                'Format' : to_d3d12_format(img.base_format, True),
+                'Format' : to_d3d12_format(base_format, True),
                 'MipLevels' : img.desc.mips,
                 'DepthOrArraySize' : max(img.desc.depth, img.desc.arraysize),
-                'PixelSize' : to_d3d12_pixel_size(img.base_format),
+                'PixelSize' : to_d3d12_pixel_size(base_format),
                 'CastFormats' : cast_formats,
                 'data': img.paths
             }
@@ -625,7 +2659,7 @@ def export_callback(ctx : qrd.CaptureContext, data):
 
             # For now, only support reading the depth aspect as an SRV for packed depth-stencil.
             # D3D12 does not support castable on planar formats, just revert back to older behavior.
-            match img.base_format.type:
+            match base_format.type:
                 case rd.ResourceFormatType.D16S8:
                     res['PixelSlice'] = 2
                     res['CastFormats'] = []
@@ -642,262 +2676,255 @@ def export_callback(ctx : qrd.CaptureContext, data):
 
             resources.append(res)
 
-    srvs = []
-    uavs = []
-    cbvs = []
-    desc_samplers = []
-    used_resource_heap_offsets = set()
-    used_sampler_heap_offsets = set()
-
-    for r in samplers:
-        block = reflection.samplers[r.access.index]
-        samp = r.sampler
-        # Skip immutable samplers
-        if block.bindArraySize == 1 or samp.creationTimeConstant:
-            continue
-        if r.access.arrayElement in used_sampler_heap_offsets:
-            continue
-        used_sampler_heap_offsets.add(r.access.arrayElement)
-        desc = {
-            'HeapOffset' : r.access.arrayElement,
-            'AddressU' : convert_address(samp.addressU),
-            'AddressV' : convert_address(samp.addressV),
-            'AddressW' : convert_address(samp.addressW),
-            'ComparisonFunc' : convert_comparison_func(samp.compareFunction),
-            'MaxAnisotropy' : int(samp.maxAnisotropy),
-            'MinLOD' : samp.minLOD,
-            'MaxLOD' : samp.maxLOD,
-            'MipLODBias' : samp.mipBias,
-            'Filter' : convert_filter(samp.filter)
+    for c in plan.constant_buffers:
+        res = {
+            'name' : c.name,
+            'Dimension' : 'BUFFER',
+            'Width' : c.size,
+            'data' : [ c.path ]
         }
+        resources.append(res)
+
+    return resources
+
+def write_capture_json(plan : ExportPlan, dir_path, options : ExportOptions, blob_output : BlobOutput, progress : ExportProgress,
+                       dropped, skipped, reused = {}):
+    profiler = plan.profiler
+    resources = plan_resources(plan)
+
+    for res in resources:
+        written = [ reused[path] if path in reused else blob_output.resolve(path) if path and path not in dropped else (None, None)
+                    for path in res['data'] ]
+        res['data'] = [ x[0] for x in written ]
+        # Lets the replayer know which blobs need to be decompressed.
+        if options.compression and not options.archive:
+            res['DataCompression'] = [ x[1] if x[1] else 'none' for x in written ]
+        # Blobs are named ranges of the archive instead of files.
+        if options.archive:
+            res['DataArchiveRange'] = [ blob_output.locate(path) if path else None for path in res['data'] ]
+
+    blob_store_dir = options.resolve_blob_store(dir_path)
+    if blob_store_dir and options.archive:
+        print('Blob store is not used when writing an archive.')
+    elif blob_store_dir:
+        progress.set_phase(f'Moving blobs to store {blob_store_dir}')
+        profiler.begin_phase('Blob store')
+        store = BlobStore(blob_store_dir)
+        for res in resources:
+            res['data'] = [ store.ingest(dir_path, path) if path else path for path in res['data'] ]
 
-        if samp.UseBorder():
-            desc['BorderColor'] = [ x for x in samp.borderColorValue.float ]
-        desc_samplers.append(desc)
-
-    # Standalone CBVs are always small, so ignore them w.r.t. subrange tracking.
-    for r in cbv:
-        block = reflection.constantBlocks[r.access.index]
-        if block.compileConstants or (not block.bufferBacked):
-            continue
-        if block.bindArraySize == 1:
-            # Handle push descriptors later
-            continue
-        if r.access.arrayElement in used_resource_heap_offsets:
-            continue
-        used_resource_heap_offsets.add(r.access.arrayElement)
-
-        name = f'cbv{blob_index}'
-        path = name + '.bin'
-        blob_index += 1
-
-        if r.descriptor.resource:
-            ctx.Replay().BlockInvoke(lambda replayer :
-                                    dump_binary_to_file(os.path.join(dir_path, path),
-                                                        replayer.GetBufferData(r.descriptor.resource,
-                                                                                r.descriptor.byteOffset,
-                                                                                r.descriptor.byteSize)))
-
-            res = {
-                'name' : name,
-                'Dimension' : 'BUFFER',
-                'Width' : r.descriptor.byteSize,
-                'data' : [ path ]
-            }
-            resources.append(res)
-
-        cbv_desc = {
-            'HeapOffset' : r.access.arrayElement,
-            'Resource' : 'NULL' if r.descriptor.resource == 0 else name,
-            'BufferLocation' : 0,
-            'SizeInBytes' : r.descriptor.byteSize
-        }
-        cbvs.append(cbv_desc)
-
-    # Try to fish out UAV counters (only works with AMD-style embedded layout for now)
-    used_resource_heap_atomic_counter_candidates = {}
-    used_resource_heap_raw_buffer_access = set()
-    for r in rw:
-        if is_buffer(r.descriptor.type):
-            if is_typed(r.descriptor.type) and r.descriptor.byteSize == 4 and r.descriptor.format.Name() == 'R32_UINT':
-                used_resource_heap_atomic_counter_candidates[r.access.arrayElement] = (r.descriptor.resource, r.descriptor.byteOffset)
-            elif not is_typed(r.descriptor.type):
-                used_resource_heap_raw_buffer_access.add(r.access.arrayElement)
-
-    for kind in [ro, rw]:
-        for r in kind:
-            if is_uav(r.descriptor.type):
-                res = reflection.readWriteResources[r.access.index]
-            else:
-                res = reflection.readOnlyResources[r.access.index]
-
-            name = res.name
-
-            if res.bindArraySize == 1:
-                continue
-
-            # Do not directly emit UAV counters.
-            is_counter_candidate = r.access.arrayElement in used_resource_heap_atomic_counter_candidates
-            is_raw_candidate = r.access.arrayElement in used_resource_heap_raw_buffer_access
-            if is_counter_candidate and is_raw_candidate and is_buffer(r.descriptor.type) and is_typed(r.descriptor.type):
-                continue
+    capture = {}
+    capture['CS'] = plan.dxil_name
+    if options.archive:
+        capture['Archive'] = ArchiveOutput.file_name
+    capture['RootSignature'] = 'rootsig.rs'
+    capture['Dispatch'] = list(plan.dispatch_dimension)
+    capture['Resources'] = resources
+    if options.descriptor_runs:
+        capture['DescriptorRunEncoding'] = 1
+        capture['SRV'] = encode_descriptor_runs(plan.srvs)
+        capture['UAV'] = encode_descriptor_runs(plan.uavs)
+        capture['CBV'] = encode_descriptor_runs(plan.cbvs)
+        capture['Sampler'] = encode_descriptor_runs(plan.samplers)
+    else:
+        capture['SRV'] = plan.srvs
+        capture['UAV'] = plan.uavs
+        capture['CBV'] = plan.cbvs
+        capture['Sampler'] = plan.samplers
+    capture['RootParameters'] = plan.root_parameters
+    if options.budget > 0:
+        capture['Budget'] = { 'Limit' : options.budget, 'Policy' : options.budget_policy, 'Skipped' : skipped }
+
+    progress.set_phase('Writing capture.json')
+    profiler.begin_phase('Write capture.json')
+    with open(os.path.join(dir_path, 'capture.json'), 'w') as f:
+        if options.compact_json:
+            write_json_compact(f, capture)
+        else:
+            print(json.dumps(capture, indent = 4), file = f)
 
-            desc = { 'HeapOffset' : r.access.arrayElement }
-            # Can happen for aliased resources for vectorization purposes, just ignore
-            if r.access.arrayElement in used_resource_heap_offsets:
-                continue
-            used_resource_heap_offsets.add(r.access.arrayElement)
-
-            force_srv = 'SRV' in name
-            uav = is_uav(r.descriptor.type) and (not force_srv)
-
-            if is_buffer(r.descriptor.type):
-                buf = None if r.descriptor.resource == 0 else unique_buffer_resources[r.descriptor.resource]
-                if buf:
-                    buf_range : BufferRange = buf.find_matching_range(r.descriptor.byteOffset, uav)
-                    if buf_range:
-                        desc['Resource'] = buf_range.name + ('.rw' if uav else '.ro')
-                        desc['ViewDimension'] = 'BUFFER'
-
-                        if is_typed(r.descriptor.type):
-                            if offset_buffer:
-                                # Rewrite the offset / size to match the offset buffer values.
-                                # Ignore offset buffer for SSBO since no driver should hit that path anymore.
-                                offset = r.descriptor.byteOffset + r.descriptor.format.ElementSize() * offset_buffer[4 * r.access.arrayElement + 2]
-                                size = r.descriptor.format.ElementSize() * offset_buffer[4 * r.access.arrayElement + 3]
-                            else:
-                                offset = r.descriptor.byteOffset
-                                size = r.descriptor.byteSize
-
-                            desc['Format'] = to_d3d12_format(r.descriptor.format, False)
-                            element_size = r.descriptor.format.ElementSize()
-                            if (offset - buf_range.start_offset) % element_size != 0:
-                                print('TexelBuffer does not align properly to buffer start. Is game using non 64 KiB alignment?')
-                            desc['FirstElement'] = (offset - buf_range.start_offset) // element_size
-                            desc['NumElements'] = size // element_size
-                        else:
-                            decoded_name = name.split('_')
-                            if len(decoded_name) >= 3:
-                                element_size = 0
-
-                                if decoded_name[1] == 'StructuredBuffer':
-                                    element_size = int(decoded_name[2])
-                                    desc['StructureByteStride'] = element_size
-
-                                    if is_counter_candidate:
-                                        counter = used_resource_heap_atomic_counter_candidates[r.access.arrayElement]
-                                        counter_buf = unique_buffer_resources[counter[0]]
-                                        counter_buf_range : BufferRange = counter_buf.find_matching_range(counter[1], True)
-                                        desc['CounterResource'] = counter_buf_range.name + '.rw'
-                                        desc['CounterOffsetInBytes'] = counter[1] - counter_buf_range.start_offset
-                                elif decoded_name[1] == 'ByteAddressBuffer':
-                                    desc['Format'] = 'R32_TYPELESS'
-                                    desc['Flags'] = 'RAW'
-                                    element_size = 4
-                                else:
-                                    print(f'Unrecognized resource type {decoded_name[1]}')
-
-                                if (r.descriptor.byteOffset - buf_range.start_offset) % element_size != 0:
-                                    print('Raw buffer does not align properly to buffer start. Is game using non 64 KiB alignment?')
-                                desc['FirstElement'] = (r.descriptor.byteOffset - buf_range.start_offset) // element_size
-                                desc['NumElements'] = r.descriptor.byteSize // element_size
-                    else:
-                        print('Could not find matching range?')
-                else:
-                    desc['Resource'] = 'NULL'
-                    desc['ViewDimension'] = 'BUFFER'
-                    desc['Format'] = 'R32_UINT'
-                    if not is_typed(r.descriptor.type):
-                        desc['Flags'] = 'RAW'
-                        desc['Format'] = 'R32_TYPELESS'
-
-            elif is_image(r.descriptor.type):
-                img = None if r.descriptor.resource == 0 else unique_texture_resources[r.descriptor.resource]
-                desc['Resource'] = (img.name + ('.rw' if uav else '.ro')) if img else 'NULL'
-                desc['ViewDimension'] = to_view_type(r.descriptor.textureType)
-                desc['Format'] = to_d3d12_format(r.descriptor.format, False)
-                if img:
-                    if view_type_has_mip_range(r.descriptor.textureType, uav):
-                        desc['MostDetailedMip'] = r.descriptor.firstMip
-                        desc['MipLevels'] = r.descriptor.numMips
-                        desc['ResourceMinLODClamp'] = r.descriptor.minLODClamp
-
-                    if view_type_has_mip_slice(r.descriptor.textureType, uav):
-                        desc['MipSlice'] = r.descriptor.firstMip
-
-                    if view_type_has_array_range(r.descriptor.textureType, uav):
-                        desc['FirstArraySlice'] = r.descriptor.firstSlice
-                        desc['ArraySize'] = r.descriptor.numSlices
-
-                    if view_type_has_cube_range(r.descriptor.textureType, uav):
-                        desc['First2DArrayFace'] = r.descriptor.firstSlice
-                        desc['NumCubes'] = r.descriptor.numSlices
-
-                    #if view_type_has_wsize(r.descriptor.textureType, uav):
-                    #    desc['FirstWSlice'] = r.descriptor.firstSlice
-                    #    desc['WSize'] = r.descriptor.numSlices
-            else:
-                print(f'Skipping unknown resource.')
+    # Every file the export consists of.
+    files = [ 'capture.json', capture['RootSignature'] ]
+    if options.archive:
+        files.append(ArchiveOutput.file_name)
+    else:
+        files.extend(path for res in resources for path in res['data'] if path)
+    return list(dict.fromkeys(files))
+
+# Fields which may step by a constant within a descriptor run, HeapOffset always steps by one.
+descriptor_run_stride_fields = ('HeapOffset', 'FirstElement')
+
+def descriptor_shape(desc):
+    return [ (key, value) for key, value in desc.items() if key not in descriptor_run_stride_fields ]
+
+def encode_descriptor_runs(descs):
+    # Descriptors for consecutive heap offsets which only differ in HeapOffset and a constant FirstElement step
+    # are folded into their first descriptor, with RunLength and FirstElementStride added.
+    # Entry i of a run is the first descriptor with HeapOffset + i and FirstElement + i * FirstElementStride.
+    runs = []
+    run = None
+    for desc in sorted(descs, key = lambda desc : desc['HeapOffset']):
+        if run is not None and desc['HeapOffset'] == prev['HeapOffset'] + 1 and descriptor_shape(desc) == shape:
+            step = desc.get('FirstElement', 0) - prev.get('FirstElement', 0)
+            length = run.get('RunLength', 1)
+            if length == 1 or step == stride:
+                stride = step
+                run['RunLength'] = length + 1
+                if stride:
+                    run['FirstElementStride'] = stride
+                prev = desc
                 continue
+        run = dict(desc)
+        shape = descriptor_shape(desc)
+        stride = 0
+        prev = desc
+        runs.append(run)
+    return runs
+
+def write_json_compact(f, obj, batch_size = 4096):
+    # Top-level arrays are written in batches of elements, so the whole manifest never exists as one string.
+    f.write('{')
+    for i, (key, value) in enumerate(obj.items()):
+        if i:
+            f.write(',')
+        f.write(json.dumps(key) + ':')
+        if isinstance(value, list):
+            f.write('[')
+            for start in range(0, len(value), batch_size):
+                if start:
+                    f.write(',')
+                f.write(','.join(json.dumps(x, separators = (',', ':')) for x in value[start : start + batch_size]))
+            f.write(']')
+        else:
+            f.write(json.dumps(value, separators = (',', ':')))
+    f.write('}\n')
+
+def export_dispatch(source, eid, dir_path, options : ExportOptions):
+    plan = plan_dispatch(source, eid, options)
+    dump_dispatch(source, plan, dir_path, options)
+    return plan
+
+class ExportJob(threading.Thread):
+    def __init__(self, source, plan : ExportPlan, dir_path, options : ExportOptions, progress : ExportProgress, on_done):
+        super().__init__(daemon = True)
+        self.source = source
+        self.plan = plan
+        self.dir_path = dir_path
+        self.options = options
+        self.progress = progress
+        self.on_done = on_done
+        self.error = None
+
+    def run(self):
+        try:
+            write_dispatch(self.source, self.plan, self.dir_path, self.options, self.progress)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.on_done()
+
+class ExportProgressWindow():
+    def __init__(self, ctx : qrd.CaptureContext):
+        self.mqt : qrd.MiniQtHelper = ctx.Extensions().GetMiniQtHelper()
+        self.progress : Optional[ExportProgress] = None
+        self.last_update = 0.0
+        self.widget = self.mqt.CreateToplevelWidget('Exporting D3D12 Replayer Capture', lambda c, w, d: self.cancel())
+        self.phase_label = self.mqt.CreateLabel()
+        self.bytes_label = self.mqt.CreateLabel()
+        self.progress_bar = self.mqt.CreateProgressBar(True)
+        self.cancel_button = self.mqt.CreateButton(lambda c, w, d: self.cancel())
+        self.mqt.SetWidgetText(self.cancel_button, 'Cancel')
+        for w in [self.phase_label, self.bytes_label, self.progress_bar, self.cancel_button]:
+            self.mqt.AddWidget(self.widget, w)
+
+    def cancel(self):
+        if self.progress:
+            self.progress.cancel()
+        self.mqt.SetWidgetText(self.phase_label, 'Cancelling ...')
+
+    def update(self, progress : ExportProgress):
+        # Called from any thread, possibly very often, so throttle what we push to the UI thread.
+        now = time.monotonic()
+        if progress.bytes_done != progress.bytes_total and progress.bytes_done != 0 and now - self.last_update < 0.1:
+            return
+        self.last_update = now
+        phase = progress.phase
+        done = progress.bytes_done
+        total = progress.bytes_total
+        def apply():
+            if progress.cancelled():
+                return
+            self.mqt.SetWidgetText(self.phase_label, phase)
+            self.mqt.SetWidgetText(self.bytes_label, f'{done / (1024 * 1024):.1f} / {total / (1024 * 1024):.1f} MiB')
+            self.mqt.SetProgressBarValue(self.progress_bar, int(100 * done / total) if total else 0)
+        self.mqt.InvokeOntoUIThread(apply)
 
-            if uav:
-                uavs.append(desc)
-            else:
-                srvs.append(desc)
-
-    root_parameters = []
+def export_callback(ctx : qrd.CaptureContext, data):
+    global export_in_progress
+    print('Trying to export ...')
+    options = ExportOptions()
+    eid = ctx.CurEvent()
+    print('Got EID {}'.format(eid))
 
-    for res in spirv_resources:
-        kind = res[0]
-        index = res[1]
-        pushoffset = res[2] // 4
-        pushsize = res[3] // 4
-        if kind == 'SRV' or kind == 'UAV' or kind == 'CBV':
-            bda = push[pushoffset] | (push[pushoffset + 1] << 32)
-            resid, offset, _ = lookup_bda(ctx, bda, 0x10000 if kind == 'CBV' else 0xffffffff)
-            if resid != 0:
-                unique_buf = unique_buffer_resources[resid]
-                uav = kind == 'UAV'
-                buf_range = unique_buf.find_matching_range(offset, uav)
-                if buf_range:
-                    root_parameters.append({ 'index' : index, 'type' : kind, 'Resource' : buf_range.name + ('.rw' if uav else '.ro'), 'offset' : offset - buf_range.start_offset })
-                else:
-                    ctx.Extensions().ErrorDialog('Could not find buffer range for resource. Probably a bug in the script.')
-                    return
-            else:
-                print(f'Failed to lookup BDA {hex(bda)}, cannot dump parameter {index}')
-        elif kind == 'ResourceTable' or kind == 'SamplerTable':
-            root_parameters.append({ 'index' : index, 'type' : kind, 'offset' : push[pushoffset] })
-        elif kind == 'Constant':
-            root_parameters.append({ 'index' : index, 'type' : kind, 'data' : push[pushoffset : pushoffset + pushsize] })
-        elif kind == 'PushCBV':
-            # Dump push descriptors
-            push_set = res[2]
-            push_desc = res[3]
-            for c in cbv:
-                block = reflection.constantBlocks[c.access.index]
-                if block.fixedBindSetOrSpace == push_set and block.fixedBindNumber == push_desc:
-                    unique_buf = unique_buffer_resources[c.descriptor.resource]
-                    buf_range = unique_buf.find_matching_range(offset, False)
-                    if buf_range:
-                        root_parameters.append({ 'index' : index, 'type' : 'CBV', 'Resource' : buf_range.name + '.ro', 'offset' : c.descriptor.byteOffset - buf_range.start_offset })
-                    else:
-                        ctx.Extensions().ErrorDialog('Could not find buffer range for resource. Probably a bug in the script.')
-                        return
-                    break
+    source = UIExportSource(ctx)
+    plan = take_speculative_plan(eid, options)
+    if plan is None:
+        try:
+            plan = plan_dispatch(source, eid, options)
+        except ExportError as e:
+            ctx.Extensions().ErrorDialog(str(e), 'Export Error')
+            return
+    else:
+        print('Using precomputed export plan')
+        # Speculative plans are not cached until they are actually exported.
+        if plan.cache_key is None:
+            cache_plan(source, plan, options)
+
+    if options.dry_run:
+        lines = describe_plan(plan, options)
+        print('\n'.join(lines))
+        # Huge heaps would make the dialog unusable, the full list is in the log.
+        if len(lines) > 40:
+            lines = lines[:40] + [ f'... {len(lines) - 40} more lines in the log' ]
+        ctx.Extensions().MessageDialog('\n'.join(lines), 'Export dry run')
+        return
 
-    capture['Resources'] = resources
-    capture['SRV'] = srvs
-    capture['UAV'] = uavs
-    capture['CBV'] = cbvs
-    capture['Sampler'] = desc_samplers
-    capture['RootParameters'] = root_parameters
+    dir_path = ctx.Extensions().OpenDirectoryName(f'Export to directory (about {plan.estimated_bytes() / (1024 * 1024):.1f} MiB)')
 
-    with open(os.path.join(dir_path, 'capture.json'), 'w') as f:
-        print(json.dumps(capture, indent = 4), file = f)
+    if len(dir_path) == 0:
+        ctx.Extensions().ErrorDialog('No directory selected, skipping export', 'Export Error')
+        return
 
-    ctx.SetEventID([], eid, eid)
+    # Dumping can take minutes, so run it as a background job while a modal progress dialog keeps the UI alive.
+    # Being modal also stops the user from moving to another event while we're reading state.
+    mqt = ctx.Extensions().GetMiniQtHelper()
+    progress_window = ExportProgressWindow(ctx)
+    progress = ExportProgress(progress_window.update)
+    progress_window.progress = progress
+    job = ExportJob(source, plan, dir_path, options, progress,
+                    lambda : mqt.InvokeOntoUIThread(lambda : mqt.CloseCurrentDialog(True)))
+
+    # Replay state must be changed from the UI thread.
+    export_in_progress = True
+    try:
+        source.set_event(eid - 1)
+        job.start()
+        mqt.ShowWidgetAsDialog(progress_window.widget)
+        # If the dialog was closed early, the job has been asked to stop at the next resource.
+        job.join()
+        source.set_event(eid)
+    finally:
+        export_in_progress = False
+    mqt.CloseToplevelWidget(progress_window.widget)
+
+    if isinstance(job.error, ExportCancelled):
+        ctx.Extensions().MessageDialog('Export was cancelled, the output directory is incomplete.', 'Export cancelled')
+        return
+    elif job.error is not None:
+        ctx.Extensions().ErrorDialog(str(job.error), 'Export Error')
+        return
 
+    dxil_name = plan.dxil_name
     effective_dxil_path = os.path.join(dir_path, dxil_name)
     need_copy_dialog = False
     try:
@@ -908,38 +2935,47 @@ def export_callback(ctx : qrd.CaptureContext, data):
         print(f'{effective_dxil_path} does not exist.')
 
     if need_copy_dialog:
+        # Configured or previously searched trees don't need to ask.
+        input_dxil_path = find_dxil(options, dxil_name)
+        if input_dxil_path:
+            try:
+                shutil.copy(input_dxil_path, effective_dxil_path)
+                ctx.Extensions().MessageDialog(f'Exported capture successfully. Copied {dxil_name} from {input_dxil_path}.', 'Success :3')
+                return
+            except:
+                print(f'Failed to copy {input_dxil_path}')
+
         dialog_result = ctx.Extensions().QuestionDialog(
             f'Exported capture successfully. {dxil_name} is not in the output directory. Will you search for it now? The file can be copied manually later.',
             [qrd.DialogButton.OK, qrd.DialogButton.Cancel],
             'Success :3')
         if dialog_result == qrd.DialogButton.OK:
             search_dir = ctx.Extensions().OpenDirectoryName(f'Search directory for {dxil_name}', 'Search ...')
-            found_file = False
-            for root, dirs, files in os.walk(search_dir):
-                for file in files:
-                    if file == dxil_name:
-                        input_dxil_path = os.path.join(root, file)
-                        try:
-                            if input_dxil_path != effective_dxil_path:
-                                shutil.copy(input_dxil_path, effective_dxil_path)
-                            ctx.Extensions().MessageDialog(f'Found {dxil_name}')
-                            found_file = True
-                            break
-                        except:
-                            ctx.Extensions().ErrorDialog('Failed to copy file ...')
-                if found_file:
-                    break
-
-            if not found_file:
+            input_dxil_path = find_dxil(options, dxil_name, [ search_dir ], remember = True) if search_dir else None
+            if input_dxil_path:
+                try:
+                    if input_dxil_path != effective_dxil_path:
+                        shutil.copy(input_dxil_path, effective_dxil_path)
+                    ctx.Extensions().MessageDialog(f'Found {dxil_name}')
+                except:
+                    ctx.Extensions().ErrorDialog('Failed to copy file ...')
+            else:
                 ctx.Extensions().ErrorDialog(f'Could not find {dxil_name} in the tree structure of {search_dir}. Capture is incomplete without this file.')
 
     else:
         ctx.Extensions().MessageDialog(f'Exported capture successfully.', 'Success :3')
 
 def register(version : str, ctx : qrd.CaptureContext):
+    global capture_cache_tracker
     print(f'Loading exporter for version {version}')
+    capture_cache_tracker = CaptureCacheTracker(ctx)
+    ctx.AddCaptureViewer(capture_cache_tracker)
     ctx.Extensions().RegisterWindowMenu(qrd.WindowMenu.Window, ["Export vkd3d-proton to D3D12 Replayer Capture"], export_callback)
 
 def unregister():
+    global capture_cache_tracker
     print('Unregistering exporter')
-
+    if capture_cache_tracker is not None:
+        capture_cache_tracker.ctx.RemoveCaptureViewer(capture_cache_tracker)
+        capture_cache_tracker = None
+    invalidate_capture_cache()
@@ -0,0 +1,179 @@
+'''
+D3D12 vkd3d-proton exporter, headless batch mode - Copyright 2025 Hans-Kristian Arntzen for Valve Corporation
+SPDX-Licence-Identifier: MIT
+
+Exports every matching compute dispatch of a capture, each into its own subdirectory.
+Only needs the renderdoc Python module, e.g.:
+
+    PYTHONPATH=/path/to/renderdoc/build/lib:/path/to/rdoc-helper-utils python3 -m exporter capture.rdc output/
+'''
+
+import argparse
+import os
+import shutil
+import sys
+import renderdoc as rd
+from . import ExportOptions, ExportError, IncrementalExport, ReplayExportSource, describe_plan, dispatch_dxil_name, dump_dispatch, find_dxil, iterate_actions, parse_byte_size, plan_dispatch
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog = 'exporter', description = 'Export vkd3d-proton dispatches to D3D12 Replayer captures.')
+    parser.add_argument('capture', help = 'Path to .rdc capture')
+    parser.add_argument('output', help = 'Output directory, every dispatch is exported to a subdirectory')
+    parser.add_argument('--first-eid', type = int, default = 0, help = 'First EID to consider')
+    parser.add_argument('--last-eid', type = int, default = 0xffffffff, help = 'Last EID to consider')
+    parser.add_argument('--shader', default = '', help = 'Only export dispatches whose DXIL name contains this string')
+    parser.add_argument('--dxil-search', action = 'append',
+                        help = 'Directory tree to copy missing .dxil files from, can be repeated. Replaces RDOC_EXPORT_DXIL_ROOTS')
+    parser.add_argument('--dxil-index', help = 'Path of the persistent .dxil filename index')
+    parser.add_argument('--referenced-subresources-only', action = 'store_true',
+                        help = 'Only dump texture subresources referenced by views')
+    parser.add_argument('--blob-store', help = 'Content-addressed blob store shared between exports')
+    parser.add_argument('--compression', choices = ['', 'zlib', 'lzma'], help = 'Compress blobs')
+    parser.add_argument('--compression-threshold', type = float, help = 'Only keep compressed blobs smaller than this ratio')
+    parser.add_argument('--profile', action = 'store_true', help = 'Write a Chrome trace and summary of the export next to capture.json')
+    parser.add_argument('--archive', action = 'store_true', help = 'Pack all blobs into a single capture.pack')
+    parser.add_argument('--compact-json', action = 'store_true', help = 'Write capture.json without indentation')
+    parser.add_argument('--descriptor-runs', action = 'store_true',
+                        help = 'Fold descriptors of consecutive heap offsets with identical shape into runs')
+    parser.add_argument('--incremental', action = 'store_true',
+                        help = 'Only dump blobs of resources written since an earlier exported dispatch, reference the earlier blobs otherwise')
+    parser.add_argument('--dry-run', action = 'store_true', help = 'Only report the blobs and bytes each export would write')
+    parser.add_argument('--budget', help = 'Byte budget per export, e.g. 2G')
+    parser.add_argument('--readback-chunk', help = 'Read buffers back in chunks of this size, e.g. 64M')
+    parser.add_argument('--plan-cache', help = 'Directory to cache export plans in, enables reusing plans and earlier exports')
+    parser.add_argument('--plan-cache-size', help = 'Size limit of the plan cache, e.g. 256M, 0 disables it')
+    parser.add_argument('--budget-policy', choices = ['refuse', 'truncate', 'zero'], help = 'What to do with blobs over budget')
+    return parser.parse_args(argv)
+
+def create_options(args):
+    # Defaults come from the environment, same as the UI.
+    options = ExportOptions()
+    if args.referenced_subresources_only:
+        options.referenced_subresources_only = True
+    if args.blob_store is not None:
+        options.blob_store = args.blob_store
+    if args.compression is not None:
+        options.compression = args.compression
+    if args.compression_threshold is not None:
+        options.compression_threshold = args.compression_threshold
+    if args.profile:
+        options.profile = True
+    if args.dry_run:
+        options.dry_run = True
+    if args.archive:
+        options.archive = True
+    if args.dxil_search is not None:
+        options.dxil_roots = args.dxil_search
+    if args.dxil_index is not None:
+        options.dxil_index = args.dxil_index
+    if args.incremental:
+        options.incremental = True
+    if args.compact_json:
+        options.compact_json = True
+    if args.descriptor_runs:
+        options.descriptor_runs = True
+    if args.budget is not None:
+        options.budget = parse_byte_size(args.budget)
+    if args.budget_policy is not None:
+        options.budget_policy = args.budget_policy
+    if args.plan_cache is not None:
+        options.plan_cache = args.plan_cache
+    if args.plan_cache_size is not None:
+        options.plan_cache_size = parse_byte_size(args.plan_cache_size)
+    if args.readback_chunk is not None:
+        options.readback_chunk_size = max(4096, parse_byte_size(args.readback_chunk))
+    return options
+
+def find_dispatches(controller : rd.ReplayController, first_eid, last_eid):
+    return [ action.eventId for action in iterate_actions(controller.GetRootActions())
+             if (action.flags & rd.ActionFlags.Dispatch) and first_eid <= action.eventId <= last_eid ]
+
+def export_dispatches(controller : rd.ReplayController, args, options : ExportOptions):
+    source = ReplayExportSource(controller, capture_path = args.capture)
+    dispatches = find_dispatches(controller, args.first_eid, args.last_eid)
+    print(f'Found {len(dispatches)} dispatches.')
+
+    incremental = None
+    if options.incremental and (options.archive or options.blob_store):
+        print('Archives and blob stores are not incremental, exporting every dispatch in full.')
+    elif options.incremental:
+        incremental = IncrementalExport(source)
+
+    exported = 0
+    for eid in dispatches:
+        source.set_event(eid)
+        # Filtered before planning, so skipped dispatches are neither analyzed nor cached.
+        if args.shader and args.shader not in (dispatch_dxil_name(source) or ''):
+            continue
+
+        try:
+            plan = plan_dispatch(source, eid, options)
+        except ExportError as e:
+            print(f'Skipping EID {eid}: {e}')
+            continue
+
+        if options.dry_run:
+            print('\n'.join(describe_plan(plan, options)))
+            exported += 1
+            continue
+
+        dir_path = os.path.join(args.output, f'eid{eid}')
+        created = not os.path.isdir(dir_path)
+        os.makedirs(dir_path, exist_ok = True)
+        print(f'Exporting EID {eid} ({plan.dxil_name}) to {dir_path}')
+
+        try:
+            dump_dispatch(source, plan, dir_path, options, incremental = incremental)
+        except ExportError as e:
+            print(f'Failed to export EID {eid}: {e}')
+            # Don't leave directories of refused exports behind.
+            if created:
+                shutil.rmtree(dir_path, ignore_errors = True)
+            continue
+
+        effective_dxil_path = os.path.join(dir_path, plan.dxil_name)
+        if not os.path.exists(effective_dxil_path):
+            input_dxil_path = find_dxil(options, plan.dxil_name)
+            if input_dxil_path:
+                shutil.copy(input_dxil_path, effective_dxil_path)
+            else:
+                print(f'Could not find {plan.dxil_name}. Capture is incomplete without this file.')
+
+        exported += 1
+
+    print(f'{"Planned" if options.dry_run else "Exported"} {exported} dispatches.')
+    return exported
+
+def main(argv):
+    args = parse_arguments(argv)
+    options = create_options(args)
+
+    rd.InitialiseReplay(rd.GlobalEnvironment(), [])
+    cap = rd.OpenCaptureFile()
+    controller = None
+    try:
+        result = cap.OpenFile(args.capture, '', None)
+        if result != rd.ResultCode.Succeeded:
+            print(f'Could not open {args.capture}: {result}')
+            return 1
+
+        if not cap.LocalReplaySupport():
+            print('Capture cannot be replayed locally')
+            return 1
+
+        result, controller = cap.OpenCapture(rd.ReplayOptions(), None)
+        if result != rd.ResultCode.Succeeded:
+            print(f'Could not replay {args.capture}: {result}')
+            return 1
+
+        # The replay is opened once and shared by all dispatches.
+        export_dispatches(controller, args, options)
+        return 0
+    finally:
+        if controller is not None:
+            controller.Shutdown()
+        cap.Shutdown()
+        rd.ShutdownReplay()
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,60 @@
+'''
+Blob output tests, using the stand-in renderdoc/qrenderdoc modules from bench/fake.
+
+    python3 -m pytest tests
+'''
+
+import os
+import sys
+import tempfile
+import unittest
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_dir, 'bench', 'fake'))
+sys.path.insert(0, root_dir)
+
+import exporter
+
+def create_options():
+    options = exporter.ExportOptions()
+    options.compression = ''
+    return options
+
+class MappedBlobTest(unittest.TestCase):
+    def test_zero_length_subresource(self):
+        with tempfile.TemporaryDirectory() as dir_path:
+            output = exporter.BlobOutput(dir_path, create_options(), exporter.ExportProfiler())
+            writer = exporter.SubresourceWriter(output)
+            writer.write('empty.bin', b'', 0, True, 0, 1)
+            writer.write('data.bin', b'\x01\x02\x03\x04', 0, True, 4, 1)
+            writer.finish()
+            self.assertEqual(os.path.getsize(os.path.join(dir_path, 'empty.bin')), 0)
+            with open(os.path.join(dir_path, 'data.bin'), 'rb') as f:
+                self.assertEqual(f.read(), b'\x01\x02\x03\x04')
+
+class ArchiveTest(unittest.TestCase):
+    def test_round_trip(self):
+        blobs = { 'buffer0.bin' : os.urandom(100000), 'buffer1.bin' : b'\x05' * 300, 'empty.bin' : b'' }
+        with tempfile.TemporaryDirectory() as dir_path:
+            output = exporter.ArchiveOutput(dir_path, exporter.ExportProfiler())
+            writer = exporter.SubresourceWriter(output)
+            for path, data in blobs.items():
+                # Two pieces each, landing out of order.
+                half = len(data) // 2
+                writer.write(path, data[half:], half, False, len(data), 2)
+                writer.write(path, data[:half], 0, True, len(data), 2)
+            writer.finish()
+            output.finish()
+
+            archive_path = os.path.join(dir_path, exporter.ArchiveOutput.file_name)
+            index = exporter.read_archive_index(archive_path)
+            self.assertEqual(set(index), set(blobs))
+            with open(archive_path, 'rb') as f:
+                for path, (offset, size) in index.items():
+                    self.assertEqual([offset, size], output.locate(path))
+                    self.assertEqual(offset % exporter.archive_alignment(size), 0)
+                    f.seek(offset)
+                    self.assertEqual(f.read(size), blobs[path])
+
+if __name__ == '__main__':
+    unittest.main()